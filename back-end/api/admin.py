@@ -1,16 +1,190 @@
-from django.contrib import admin
-from .models import Book, ContactMessage
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.auth import get_user_model
+from django.contrib.admin.views.main import ORDER_VAR
+from django.core.paginator import Paginator
+from django.db import connection, models, transaction
+from django.db.models import Count, Max, Subquery
+from django.db.models.expressions import RawSQL
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+from .models import Book, BookTombstone, ContactMessage, SellerStats
+
+User = get_user_model()
+
+# Changelists on tables larger than this show an estimated total instead of running COUNT(*)
+ESTIMATE_COUNT_ABOVE = 100000
+KEYSET_VAR = 'before'
+
+
+def estimate_rows(model):
+	"""Cheap row estimate from the engine's statistics; never scans the table."""
+	table = model._meta.db_table
+	with connection.cursor() as cursor:
+		if connection.vendor == 'mysql':
+			cursor.execute(
+				'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+				[table],
+			)
+			row = cursor.fetchone()
+			return int(row[0]) if row and row[0] is not None else None
+		if connection.vendor == 'postgresql':
+			cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+			row = cursor.fetchone()
+			return int(row[0]) if row and row[0] >= 0 else None
+	# SQLite keeps no row statistics; the max primary key is an upper bound read off the index
+	return model._base_manager.aggregate(n=Max('pk'))['n'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+	"""Paginator whose count never scans more than ESTIMATE_COUNT_ABOVE rows."""
+
+	@cached_property
+	def count(self):
+		qs = self.object_list
+		if not qs.query.where:
+			estimate = estimate_rows(qs.model)
+			if estimate is not None and estimate > ESTIMATE_COUNT_ABOVE:
+				return estimate
+		# bounded count: stops after ESTIMATE_COUNT_ABOVE + 1 rows instead of counting everything
+		return qs.order_by()[:ESTIMATE_COUNT_ABOVE + 1].count()
+
+
+class ScalableAdmin(admin.ModelAdmin):
+	"""Changelist settings for large tables: estimated counts, no facet counts, keyset paging.
+
+	Pages are ordered by -id; the "Next" link passes ?before=<last id> so deep pages are an
+	index range scan instead of an ever-growing OFFSET. A column sort (?o=) switches back to
+	plain page numbers, since an id cursor means nothing in any other order.
+	"""
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	show_facets = admin.ShowFacets.NEVER
+	ordering = ('-id',)
+	change_list_template = 'admin/api/keyset_change_list.html'
+
+	def changelist_view(self, request, extra_context=None):
+		before = request.GET.get(KEYSET_VAR)
+		if before is not None:
+			# the changelist rejects unknown query params, so take ours out first
+			request.GET = request.GET.copy()
+			del request.GET[KEYSET_VAR]
+			if ORDER_VAR not in request.GET:
+				request.keyset_before = int(before) if before.isdigit() else None
+		response = super().changelist_view(request, extra_context)
+		cl = getattr(response, 'context_data', {}).get('cl')
+		if cl is not None and cl.result_list and ORDER_VAR not in request.GET:
+			params = request.GET.copy()
+			params.pop('p', None)
+			params[KEYSET_VAR] = cl.result_list[len(cl.result_list) - 1].pk
+			response.context_data['keyset_next'] = '?' + params.urlencode()
+		return response
+
+	def get_queryset(self, request):
+		qs = super().get_queryset(request)
+		before = getattr(request, 'keyset_before', None)
+		if before is not None:
+			qs = qs.filter(pk__lt=before)
+		return qs
+
+
+def _message_search_sql(search_term):
+	"""Full-text subquery for ContactMessage ids matching every word, or None if unsupported."""
+	words = search_term.split()
+	if not words:
+		return None
+	if connection.vendor == 'sqlite':
+		match = ' '.join('"' + w.replace('"', '""') + '"' for w in words)
+		return RawSQL('SELECT rowid FROM api_contactmessage_fts WHERE api_contactmessage_fts MATCH %s', (match,))
+	if connection.vendor == 'mysql':
+		match = ' '.join('+"' + w.replace('"', '') + '"' for w in words)
+		return RawSQL('SELECT id FROM api_contactmessage WHERE MATCH(message) AGAINST (%s IN BOOLEAN MODE)', (match,))
+	return None
+
+
+def _cascade_relations(model):
+	"""Relations into `model` that a raw DELETE may clear; ValueError if any needs the collector.
+
+	Only plain CASCADE rows that nothing else points at are safe: PROTECT, SET_NULL and the
+	like, or a further level of dependents, would be silently bypassed by _raw_delete.
+	"""
+	relations = []
+	for rel in model._meta.related_objects:
+		if rel.on_delete is not models.CASCADE:
+			raise ValueError(f'{rel.related_model.__name__}.{rel.field.name} is not on_delete=CASCADE')
+		if rel.related_model._meta.related_objects:
+			raise ValueError(f'{rel.related_model.__name__} rows are referenced by other tables')
+		relations.append(rel)
+	return relations
+
+
+@admin.action(description="Delete every listing by the selected books' owners")
+def delete_owner_listings(modeladmin, request, queryset):
+	"""Set-based spam cleanup: one DELETE per related table instead of per-object deletes.
+
+	Like delete_selected, the first POST only shows what would go; the confirmation page
+	posts back with `post=yes` to actually delete.
+	"""
+	try:
+		relations = _cascade_relations(Book)
+	except ValueError as e:
+		modeladmin.message_user(request, f'Bulk delete is unsafe here ({e}); delete the books individually.', messages.ERROR)
+		return
+	owner_ids = list(queryset.values_list('owner_id', flat=True).distinct())
+	if request.POST.get('post') != 'yes':
+		owners = (
+			User.objects.filter(pk__in=owner_ids).annotate(listings=Count('books')).order_by('username')
+		)
+		return TemplateResponse(request, 'admin/api/delete_owner_listings_confirmation.html', {
+			**modeladmin.admin_site.each_context(request),
+			'title': 'Are you sure?',
+			'opts': modeladmin.model._meta,
+			'owners': owners,
+			'total': sum(o.listings for o in owners),
+			'queryset': queryset,
+			'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+		})
+	with transaction.atomic():
+		# lock and list the books first, then delete exactly those: a listing created meanwhile
+		# is neither deleted without a tombstone nor left half-deleted
+		book_ids = list(Book.objects.select_for_update().filter(owner_id__in=owner_ids).values_list('id', flat=True))
+		books = Book.objects.filter(pk__in=book_ids)
+		# _raw_delete skips the per-object collector and signals, so do their work in bulk here
+		for rel in relations:
+			related = rel.related_model._base_manager.filter(**{f'{rel.field.name}__in': Subquery(books.values('id'))})
+			related._raw_delete(related.db)
+		BookTombstone.objects.bulk_create([BookTombstone(book_id=pk) for pk in book_ids], batch_size=1000)
+		books._raw_delete(books.db)
+		SellerStats.objects.filter(seller_id__in=owner_ids).update(listings=0, favorites=0, messages=0, cart_interest=0)
+	modeladmin.message_user(request, f'Deleted {len(book_ids)} listings from {len(owner_ids)} owners.')
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(ScalableAdmin):
 	list_display = ('id', 'name', 'author', 'owner', 'price', 'created_at')
 	list_filter = ('category', 'condition')
+	list_select_related = ('owner',)
 	search_fields = ('name', 'author', 'category')
+	actions = [delete_owner_listings]
 
 
 @admin.register(ContactMessage)
-class ContactMessageAdmin(admin.ModelAdmin):
+class ContactMessageAdmin(ScalableAdmin):
 	list_display = ('id', 'book', 'sender', 'recipient', 'created_at')
 	list_filter = ('created_at',)
-	search_fields = ('book__name', 'sender__username', 'recipient__username', 'message')
+	list_select_related = ('book', 'sender', 'recipient')
+	search_fields = ('=sender__username', '=recipient__username', '^book__name')
+
+	def get_search_fields(self, request):
+		# message text goes through the full-text index; fall back to LIKE where there is none
+		if connection.vendor in ('sqlite', 'mysql'):
+			return self.search_fields
+		return self.search_fields + ('message',)
+
+	def get_search_results(self, request, queryset, search_term):
+		results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+		fts = _message_search_sql(search_term) if connection.vendor in ('sqlite', 'mysql') else None
+		if fts is not None:
+			results = results | queryset.filter(id__in=fts)
+		return results, may_have_duplicates
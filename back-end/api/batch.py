@@ -0,0 +1,145 @@
+"""In-process dispatch of GET sub-requests for /api/batch/.
+
+Sub-requests reuse the parent's already authenticated user and session, so session lookup,
+authentication and the middleware stack run once per batch instead of once per call.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections, connection
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from . import bulkhead
+
+logger = logging.getLogger(__name__)
+
+# headers describing the parent POST body; a GET sub-request has none
+_BODY_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH', 'wsgi.input')
+
+
+def _sub_request(parent, path):
+    url = urlsplit(path)
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = url.path
+    sub.META = {k: v for k, v in parent.META.items() if k not in _BODY_META}
+    sub.META.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query})
+    sub.GET = QueryDict(url.query)
+    sub.COOKIES = parent.COOKIES
+    sub.session = parent.session
+    sub.user = parent.user
+    return sub
+
+
+def validate(path):
+    """Return an error message for a sub-request path we won't dispatch, else None."""
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        return 'path must be a string starting with /api/'
+    if urlsplit(path).path.rstrip('/') == '/api/batch':
+        return 'batch requests cannot be nested'
+    return None
+
+
+def _close(response):
+    """Release a response's file handles (e.g. a FileResponse from serve_image).
+
+    HttpResponse.close() would also send request_finished, whose close_old_connections()
+    receiver would close the parent request's DB connection halfway through its request,
+    so only the resource closers are run here.
+    """
+    for closer in response._resource_closers:
+        try:
+            closer()
+        except Exception:
+            pass
+    response._resource_closers.clear()
+
+
+def dispatch(parent, item_id, path):
+    """Run one GET sub-request and return {'id', 'status', 'body'}.
+
+    A failing sub-request becomes an error entry for its own id; it never fails the batch.
+    """
+    error = validate(path)
+    if error:
+        return {'id': item_id, 'status': 400, 'body': {'detail': error}}
+    sub = _sub_request(parent, path)
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return {'id': item_id, 'status': 404, 'body': {'detail': 'Not found'}}
+    sub.resolver_match = match
+    # sub-requests skip the middleware stack, so honour bulkheads here
+    limited = bulkhead.route_for(match.func, 'GET')
+    if limited and not bulkhead.try_acquire(limited):
+        return {'id': item_id, 'status': 503, 'body': {'detail': 'Server busy, please retry shortly'}}
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except Http404:
+        # plain Django views signal these by raising; DRF views already turned them into responses
+        return {'id': item_id, 'status': 404, 'body': {'detail': 'Not found'}}
+    except PermissionDenied:
+        return {'id': item_id, 'status': 403, 'body': {'detail': 'Permission denied'}}
+    except Exception:
+        logger.exception('batch sub-request %s failed', path)
+        return {'id': item_id, 'status': 500, 'body': {'detail': 'Internal server error'}}
+    finally:
+        if limited:
+            bulkhead.release(limited)
+    if hasattr(response, 'data'):
+        body = response.data
+    elif not response.streaming and response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(response.content or b'null')
+    else:
+        # files and other non-JSON bodies aren't inlined; don't leak their handles either
+        body = None
+        _close(response)
+    return {'id': item_id, 'status': response.status_code, 'body': body}
+
+
+def _dispatch_in_thread(parent, item_id, path):
+    # bracket each item the way Django brackets a request, so a pool thread's connection
+    # follows CONN_MAX_AGE and CONN_HEALTH_CHECKS: reused while young and healthy, replaced
+    # once MySQL's wait_timeout (or an error) has made it unusable
+    close_old_connections()
+    try:
+        return dispatch(parent, item_id, path)
+    finally:
+        close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Process-wide sub-request threads; each keeps its own DB connection within CONN_MAX_AGE."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4), thread_name_prefix='batch')
+        return _pool
+
+
+def dispatch_all(parent, items):
+    """Dispatch [(id, path), ...]; concurrently when BATCH_MAX_WORKERS > 1 and it is safe.
+
+    Sub-requests run on the parent's DB connection unless they can go concurrent; inside an
+    open transaction (ATOMIC_REQUESTS, tests) other threads could not see its writes, so the
+    batch then runs sequentially. Concurrent batches share one thread pool per process, so
+    a worker holds at most BATCH_MAX_WORKERS extra DB connections.
+    """
+    workers = getattr(settings, 'BATCH_MAX_WORKERS', 4)
+    if workers <= 1 or len(items) <= 1 or connection.in_atomic_block:
+        return [dispatch(parent, item_id, path) for item_id, path in items]
+    # resolve the lazy user/session once here, not racily in every thread
+    parent.user.is_authenticated
+    return list(_get_pool().map(lambda item: _dispatch_in_thread(parent, *item), items))
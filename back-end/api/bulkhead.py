@@ -0,0 +1,135 @@
+"""Per-route concurrency limits ("bulkheads") for slow endpoints.
+
+Each bulkhead in settings.BULKHEADS caps how many requests for its views may be in flight at
+once. A request that would exceed the cap is rejected straight away with 503 and Retry-After
+instead of tying up another worker, so cheap catalog reads keep flowing during spikes.
+
+In-flight counts live in the Django cache (BULKHEAD_CACHE_ALIAS), which must be shared
+across workers (settings use Redis when REDIS_URL is set). With a per-process cache the
+limit is per worker, which under gunicorn's sync workers means it never trips;
+warn_if_process_local() reports that at startup. Every acquire and release pushes a
+counter's expiry out to BULKHEAD_SLOT_TTL seconds again, so it survives steady load and only
+expires once no request has touched the route for that long; slots leaked by a crashed
+worker are reclaimed then. Keep the TTL above the slowest request on a guarded route.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+def _cache():
+    return caches[getattr(settings, 'BULKHEAD_CACHE_ALIAS', 'default')]
+
+
+def is_process_local():
+    """True if the counters' cache lives inside each process (locmem/dummy) rather than being shared."""
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+    return isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def warn_if_process_local(log, concurrency):
+    """Log a warning when bulkheads can't work: per-process counters and one request per process."""
+    if getattr(settings, 'BULKHEADS', None) and concurrency <= 1 and is_process_local():
+        log.warning(
+            'bulkheads are configured but BULKHEAD_CACHE_ALIAS is a per-process cache and each '
+            'worker serves one request at a time, so no limit will ever trip; set REDIS_URL'
+        )
+
+
+def _ttl():
+    return getattr(settings, 'BULKHEAD_SLOT_TTL', 300)
+
+
+def view_key(view_func, method):
+    """'order_view' for function views, 'ContactMessageViewSet.create' for viewset actions."""
+    cls = getattr(view_func, 'cls', None)
+    name = cls.__name__ if cls is not None else view_func.__name__
+    actions = getattr(view_func, 'actions', None)
+    if actions and method.lower() in actions:
+        return f'{name}.{actions[method.lower()]}'
+    return name
+
+
+def _routes():
+    routes = {}
+    for bulkhead, conf in getattr(settings, 'BULKHEADS', {}).items():
+        for view in conf.get('views', []):
+            routes[view] = bulkhead
+    return routes
+
+
+def route_for(view_func, method):
+    """Name of the bulkhead guarding this view/method, or None."""
+    return _routes().get(view_key(view_func, method))
+
+
+def _incr(key, delta=1):
+    cache = _cache()
+    ttl = _ttl()
+    cache.add(key, 0, ttl)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        # expired between add() and incr()
+        cache.set(key, max(delta, 0), ttl)
+        return max(delta, 0)
+    # incr() keeps the expiry set by add(); without this a busy counter would vanish mid-load
+    cache.touch(key, ttl)
+    return value
+
+
+def try_acquire(name):
+    limit = settings.BULKHEADS[name]['max_in_flight']
+    if _incr(f'bulkhead:{name}:in_flight') > limit:
+        _incr(f'bulkhead:{name}:in_flight', -1)
+        _incr(f'bulkhead:{name}:rejected')
+        return False
+    _incr(f'bulkhead:{name}:accepted')
+    return True
+
+
+def release(name):
+    if _incr(f'bulkhead:{name}:in_flight', -1) < 0:
+        _cache().set(f'bulkhead:{name}:in_flight', 0, _ttl())
+
+
+def stats():
+    """Current in-flight count and accepted/rejected totals for every configured bulkhead."""
+    cache = _cache()
+    out = {}
+    for name, conf in getattr(settings, 'BULKHEADS', {}).items():
+        out[name] = {
+            'max_in_flight': conf['max_in_flight'],
+            'in_flight': max(cache.get(f'bulkhead:{name}:in_flight', 0), 0),
+            'accepted': cache.get(f'bulkhead:{name}:accepted', 0),
+            'rejected': cache.get(f'bulkhead:{name}:rejected', 0),
+        }
+    return out
+
+
+class BulkheadMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = _routes()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        name = getattr(request, '_bulkhead', None)
+        if name is not None:
+            release(name)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.routes:
+            return None
+        name = self.routes.get(view_key(view_func, request.method))
+        if name is None:
+            return None
+        if not try_acquire(name):
+            retry_after = settings.BULKHEADS[name].get('retry_after', 5)
+            response = JsonResponse({'detail': 'Server busy, please retry shortly'}, status=503)
+            response['Retry-After'] = str(retry_after)
+            return response
+        request._bulkhead = name
+        return None
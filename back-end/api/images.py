@@ -0,0 +1,216 @@
+"""Content-addressed image store and thumbnail pipeline.
+
+Originals live at MEDIA_ROOT/images/orig/<aa>/<sha256> and thumbnails at
+MEDIA_ROOT/images/<size>/<aa>/<sha256>.jpg, so a given image is stored once and its URL
+never changes; that is what lets serve_image() hand out year-long immutable cache headers.
+Pillow is optional: without it uploads are refused (they can't be verified) and
+generate_thumbnails does nothing. Remote images are only fetched from IMAGE_ORIGIN_HOSTS.
+"""
+import hashlib
+import logging
+import os
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped when Pillow isn't installed
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMAT = 'JPEG'
+# what verify() lets in: the formats browsers and phone cameras actually produce
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+def sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {'small': (160, 240), 'medium': (320, 480)})
+
+
+def _root():
+    return os.path.join(str(settings.MEDIA_ROOT), 'images')
+
+
+def original_path(digest):
+    return os.path.join(_root(), 'orig', digest[:2], digest)
+
+
+def thumbnail_path(digest, size):
+    return os.path.join(_root(), size, digest[:2], f'{digest}.jpg')
+
+
+def thumbnail_url(digest, size):
+    return f'/api/images/{size}/{digest}.jpg'
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_original(data):
+    """Save image bytes under their sha256 and return the digest (no-op if already stored)."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = original_path(digest)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return digest
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # a redirect must not carry the fetch off the allow-list (e.g. to an internal address)
+        _check_origin(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _check_origin(url):
+    """Reject URLs that aren't http(s) on a host listed in IMAGE_ORIGIN_HOSTS.
+
+    An entry matches its exact host; an entry starting with '.' also matches subdomains.
+    An empty list disables fetching altogether.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError('only http(s) image URLs can be fetched')
+    host = (parts.hostname or '').lower()
+    for allowed in getattr(settings, 'IMAGE_ORIGIN_HOSTS', []):
+        allowed = allowed.lower()
+        if host == allowed.lstrip('.') or (allowed.startswith('.') and host.endswith(allowed)):
+            return
+    raise ValueError(f'images cannot be fetched from {host or url}')
+
+
+def fetch_origin(url):
+    """Download an image from an allowed origin host, refusing anything over IMAGE_MAX_BYTES."""
+    _check_origin(url)
+    limit = getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+    timeout = getattr(settings, 'IMAGE_FETCH_TIMEOUT', 10)
+    opener = urllib.request.build_opener(_CheckedRedirectHandler)
+    with opener.open(url, timeout=timeout) as res:
+        data = res.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'image at {url} is larger than {limit} bytes')
+    return data
+
+
+def read_upload(upload):
+    """Read an uploaded file, refusing anything over IMAGE_MAX_BYTES without reading it all."""
+    limit = getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+    if upload.size is not None and upload.size > limit:
+        raise ValueError(f'image is larger than {limit} bytes')
+    data = upload.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'image is larger than {limit} bytes')
+    return data
+
+
+def verify(data):
+    """Raise ValueError unless `data` is an intact image in a format we thumbnail. Needs Pillow."""
+    try:
+        with Image.open(BytesIO(data)) as img:
+            fmt = img.format
+            img.verify()
+    except Exception as e:  # Pillow raises a variety of errors for truncated or hostile files
+        raise ValueError(f'not a usable image: {e}')
+    if fmt not in ACCEPTED_FORMATS:
+        raise ValueError(f'{fmt} images are not accepted')
+
+
+def _render(source_path, jobs, quality):
+    """Write each (path, box) thumbnail of the image at `source_path`.
+
+    Also runs in pool processes, so everything it needs comes in as arguments rather
+    than from settings.
+    """
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    for path, box in jobs:
+        if os.path.exists(path):
+            continue
+        with Image.open(BytesIO(source)) as img:
+            img = img.convert('RGB')
+            img.thumbnail(box)
+            out = BytesIO()
+            img.save(out, THUMBNAIL_FORMAT, quality=quality, optimize=True)
+        _write_atomic(path, out.getvalue())
+
+
+def _render_args(digest):
+    jobs = [(thumbnail_path(digest, name), box) for name, box in sizes().items()]
+    return original_path(digest), jobs, getattr(settings, 'THUMBNAIL_QUALITY', 80)
+
+
+def make_thumbnails(digest):
+    """Render every configured size for a stored original in this process; returns the sizes written."""
+    if Image is None:
+        return []
+    _render(*_render_args(digest))
+    return list(sizes())
+
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # created on first use, i.e. after gunicorn has forked this worker
+        _pool = ProcessPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS)
+    return _pool
+
+
+def render_thumbnails(digest):
+    """Like make_thumbnails, but off the request thread in this process's thumbnail pool.
+
+    Resizing holds the GIL, so doing it inline would stall every other request the
+    worker is serving. THUMBNAIL_WORKERS = 0 renders inline instead.
+    """
+    global _pool
+    if Image is None:
+        return []
+    if not getattr(settings, 'THUMBNAIL_WORKERS', 0):
+        return make_thumbnails(digest)
+    try:
+        _get_pool().submit(_render, *_render_args(digest)).result()
+    except BrokenProcessPool:
+        logger.warning('thumbnail pool died; rendering %s inline', digest)
+        _pool = None
+        return make_thumbnails(digest)
+    return list(sizes())
+
+
+def _render_or_skip(args):
+    try:
+        _render(*args)
+        return True
+    except Exception:
+        logger.exception('thumbnail failed for %s', args[0])
+        return False
+
+
+def make_thumbnails_many(digests, workers=None):
+    """Thumbnail many originals in a process pool (resizing is CPU bound); returns {digest: sizes}.
+
+    Originals that cannot be decoded map to an empty list instead of failing the batch.
+    """
+    digests = list(dict.fromkeys(digests))
+    if Image is None:
+        return {d: [] for d in digests}
+    args = [_render_args(d) for d in digests]
+    if len(digests) <= 1 or workers == 1:
+        ok = [_render_or_skip(a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ok = list(pool.map(_render_or_skip, args))
+    names = list(sizes())
+    return {d: names if good else [] for d, good in zip(digests, ok)}
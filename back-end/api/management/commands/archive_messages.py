@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ContactMessage, ArchivedContactMessage
+from api.signals import archiving_messages
+
+
+class Command(BaseCommand):
+    help = 'Move contact messages older than --days into the compressed archive table, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'MESSAGES_ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive messages created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'MESSAGES_ARCHIVE_BATCH_SIZE', 1000),
+                            help='Rows moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many messages would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        old = ContactMessage.objects.filter(created_at__lt=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'{old.count()} messages older than {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        moved = 0
+        while True:
+            # each batch is copied and deleted in its own transaction so locks stay short
+            with transaction.atomic():
+                batch = list(old.order_by('id')[:batch_size])
+                if not batch:
+                    break
+                ArchivedContactMessage.objects.bulk_create(
+                    [ArchivedContactMessage.from_message(cm) for cm in batch],
+                    ignore_conflicts=True,
+                )
+                # moved, not deleted: leave the seller's message counts alone
+                with archiving_messages():
+                    ContactMessage.objects.filter(id__in=[cm.id for cm in batch]).delete()
+            moved += len(batch)
+            self.stdout.write(f'archived {moved} messages...')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} messages older than {cutoff:%Y-%m-%d}'))
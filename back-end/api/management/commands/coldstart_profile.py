@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported or cached.
+PROBE = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+django.setup()
+t1 = time.perf_counter()
+out = {{'django_setup': t1 - t0}}
+if {warm!r}:
+    from api.warmup import warm_up
+    out['warm_up'] = sum(warm_up().values())
+from django.test import Client
+client = Client()
+for label in ('first_request', 'second_request'):
+    start = time.perf_counter()
+    status = client.get({path!r}, SERVER_NAME='localhost').status_code
+    out[label] = time.perf_counter() - start
+    out[label + '_status'] = status
+print(json.dumps(out))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Print an import-time and first-request latency breakdown for a cold worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/books/', help='URL requested as the first request')
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest top-level imports to show')
+        parser.add_argument('--warm', action='store_true', help='Run api.warmup.warm_up() before the first request')
+        parser.add_argument('--json', action='store_true', help='Emit machine-readable JSON for CI')
+
+    def handle(self, *args, **options):
+        code = PROBE.format(settings_module=settings.SETTINGS_MODULE, warm=options['warm'], path=options['path'])
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, cwd=str(settings.BASE_DIR),
+        )
+        if proc.returncode != 0:
+            raise CommandError(proc.stderr[-2000:], returncode=proc.returncode)
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        imports = self._top_level_imports(proc.stderr)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'timings': timings, 'imports': imports}))
+            return
+        self.stdout.write('Top-level imports (cumulative):')
+        for module, micros in imports:
+            self.stdout.write(f'  {micros / 1000:8.1f} ms  {module}')
+        self.stdout.write('Startup:')
+        for key in ('django_setup', 'warm_up', 'first_request', 'second_request'):
+            if key in timings:
+                status = timings.get(key + '_status')
+                suffix = f'  (HTTP {status})' if status else ''
+                self.stdout.write(f'  {timings[key] * 1000:8.1f} ms  {key}{suffix}')
+
+    def _top_level_imports(self, stderr):
+        """Parse `-X importtime` output and return (module, cumulative us) for top-level imports, slowest first."""
+        rows = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # nested imports are indented under their parent; only keep the roots
+            if name.startswith(' ') and not name.startswith('  '):
+                rows.append((name.strip(), int(cumulative)))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
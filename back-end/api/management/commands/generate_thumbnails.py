@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import images
+from api.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Fetch book images from their origin URLs and build thumbnails in a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Thumbnail processes (default: CPU count)')
+        parser.add_argument('--all', action='store_true', help='Also redo books that already have thumbnails')
+
+    def handle(self, *args, **options):
+        if images.Image is None:
+            self.stderr.write('Pillow is not installed; cannot generate thumbnails')
+            return
+        books = Book.objects.exclude(image__isnull=True).exclude(image='')
+        if not options['all']:
+            books = books.filter(image_digest='')
+
+        fetched = {}
+        for book in books.only('id', 'image').iterator():
+            try:
+                data = images.fetch_origin(book.image)
+                # same gate as uploads: an error page or other non-image never reaches the store
+                images.verify(data)
+                fetched[book.pk] = images.store_original(data)
+            except Exception as e:
+                self.stderr.write(f'book {book.pk}: could not fetch {book.image}: {e}')
+
+        results = images.make_thumbnails_many(fetched.values(), workers=options['workers'])
+        # bump updated_at too, so /api/books/changes/ sends clients the new thumbnails
+        now = timezone.now()
+        done = [Book(pk=pk, image_digest=digest, updated_at=now) for pk, digest in fetched.items() if results.get(digest)]
+        Book.objects.bulk_update(done, ['image_digest', 'updated_at'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'Thumbnails ready for {len(done)} books'))
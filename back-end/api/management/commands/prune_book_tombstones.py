@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import BookTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete book tombstones older than --days; /api/books/changes/ answers 410 to sync tokens that old.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.BOOKS_TOMBSTONE_RETENTION_DAYS,
+                            help='Keep tombstones for this many days')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = BookTombstone.objects.filter(deleted_at__lt=cutoff)
+        pruned = 0
+        while True:
+            # bounded deletes keep each statement's locks short; deleted_at is indexed
+            ids = list(old.order_by('deleted_at', 'id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            pruned += BookTombstone.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} tombstones older than {cutoff:%Y-%m-%d}'))
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api.models import ArchivedContactMessage, Book, BookStats, Cart, ContactMessage, Favorite, SellerStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute SellerStats and BookStats from scratch (initial backfill or repair).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        def counts(model):
+            return dict(model.objects.values('book_id').annotate(n=Count('id')).values_list('book_id', 'n'))
+
+        favorites = counts(Favorite)
+        carts = counts(Cart)
+        messages = counts(ContactMessage)
+        for book_id, n in counts(ArchivedContactMessage).items():
+            messages[book_id] = messages.get(book_id, 0) + n
+
+        book_rows = []
+        sellers = {}
+        for book_id, owner_id in Book.objects.values_list('id', 'owner_id').iterator():
+            row = BookStats(
+                book_id=book_id,
+                seller_id=owner_id,
+                favorites=favorites.get(book_id, 0),
+                messages=messages.get(book_id, 0),
+                cart_interest=carts.get(book_id, 0),
+            )
+            book_rows.append(row)
+            totals = sellers.setdefault(owner_id, SellerStats(seller_id=owner_id))
+            totals.listings += 1
+            totals.favorites += row.favorites
+            totals.messages += row.messages
+            totals.cart_interest += row.cart_interest
+
+        with transaction.atomic():
+            BookStats.objects.all().delete()
+            SellerStats.objects.all().delete()
+            BookStats.objects.bulk_create(book_rows, batch_size=batch_size)
+            SellerStats.objects.bulk_create(sellers.values(), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {len(book_rows)} books and {len(sellers)} sellers'))
@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+def _accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}; q=0 entries are kept, they mean "not acceptable"."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = _accepted_encodings(header or '')
+    # a coding's own entry wins over '*', so 'gzip;q=0, *' still refuses gzip (RFC 9110 12.5.3)
+    weights = {c: accepted.get(c, accepted.get('*', 0)) for c in (('br',) if brotli else ()) + ('gzip',)}
+    candidates = [c for c, q in weights.items() if q > 0]
+    if not candidates:
+        return None
+    # highest q wins; on a tie prefer brotli, which is listed first
+    return max(candidates, key=weights.get)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    # mtime=0 keeps the output deterministic so identical bodies give identical bytes
+    return gzip.compress(body, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 5), mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress JSON responses with brotli or gzip, reusing cached compressed bytes for repeat bodies.
+
+    Compressed output is cached under a hash of the uncompressed body, so a hot list page that
+    many clients fetch unchanged is compressed once per cache lifetime instead of on every hit.
+    Only JSON is compressed: API bodies carry no CSRF token, which keeps BREACH off the table.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.content_types = tuple(getattr(settings, 'COMPRESSION_CONTENT_TYPES', ('application/json',)))
+        self.cache_timeout = getattr(settings, 'COMPRESSION_CACHE_TIMEOUT', 300)
+        self.cache_max_size = getattr(settings, 'COMPRESSION_CACHE_MAX_SIZE', 512 * 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(self.content_types)
+        ):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        body = response.content
+        if len(body) < self.min_size:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        compressed = self._compressed(request, response, body, encoding)
+        if len(compressed) >= len(body):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def _compressed(self, request, response, body, encoding):
+        cacheable = (
+            request.method in ('GET', 'HEAD')
+            and response.status_code == 200
+            and len(body) <= self.cache_max_size
+            and 'no-store' not in response.get('Cache-Control', '')
+        )
+        if not cacheable:
+            return compress(body, encoding)
+        cache = caches[getattr(settings, 'COMPRESSION_CACHE_ALIAS', 'default')]
+        key = f'compressed:{encoding}:{hashlib.blake2b(body, digest_size=20).hexdigest()}'
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            cache.set(key, compressed, self.cache_timeout)
+        return compressed
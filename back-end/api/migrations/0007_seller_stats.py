@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-19 13:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_archivedcontactmessage'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seller_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('listings', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+                ('cart_interest', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.book')),
+                ('favorites', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+                ('cart_interest', models.IntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-19 13:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_seller_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-view_count', '-created_at'], name='book_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_saved_searches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
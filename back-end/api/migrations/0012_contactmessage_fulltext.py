@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-19 13:40
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_contactmessage_fts USING fts5(message, content='api_contactmessage', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS api_contactmessage_fts_ai AFTER INSERT ON api_contactmessage BEGIN "
+    "INSERT INTO api_contactmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS api_contactmessage_fts_ad AFTER DELETE ON api_contactmessage BEGIN "
+    "INSERT INTO api_contactmessage_fts(api_contactmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS api_contactmessage_fts_au AFTER UPDATE OF message ON api_contactmessage BEGIN "
+    "INSERT INTO api_contactmessage_fts(api_contactmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO api_contactmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+    "INSERT INTO api_contactmessage_fts(api_contactmessage_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS api_contactmessage_fts_ai',
+    'DROP TRIGGER IF EXISTS api_contactmessage_fts_ad',
+    'DROP TRIGGER IF EXISTS api_contactmessage_fts_au',
+    'DROP TABLE IF EXISTS api_contactmessage_fts',
+]
+MYSQL_FORWARD = ['ALTER TABLE api_contactmessage ADD FULLTEXT INDEX api_contactmessage_message_ft (message)']
+MYSQL_REVERSE = ['ALTER TABLE api_contactmessage DROP INDEX api_contactmessage_message_ft']
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        sql = statements.get(schema_editor.connection.vendor, [])
+        for statement in sql:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """Full-text index over ContactMessage.message for admin search (FTS5 on SQLite, FULLTEXT on MySQL)."""
+
+    dependencies = [
+        ('api', '0011_book_image_digest'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'mysql': MYSQL_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'mysql': MYSQL_REVERSE}),
+        ),
+    ]
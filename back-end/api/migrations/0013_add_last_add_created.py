@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_contactmessage_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_add_created',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='last_add_created',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 13:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_add_last_add_created'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookstats',
+            index=models.Index(fields=['seller', '-book'], name='bookstats_seller_book_idx'),
+        ),
+    ]
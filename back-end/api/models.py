@@ -1,5 +1,8 @@
-from django.db import models
+import zlib
+
+from django.db import models, connection, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -20,13 +23,38 @@ class Book(models.Model):
 	description = models.TextField(blank=True)
 	# Use URLField to avoid Pillow dependency for local dev; can switch to ImageField later
 	image = models.URLField(blank=True, null=True)
+	# sha256 of the stored original; thumbnails are served from /api/images/<size>/<digest>.jpg
+	image_digest = models.CharField(max_length=64, blank=True)
 	owner = models.ForeignKey(User, related_name='books', on_delete=models.CASCADE)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	# flushed in batches by api.view_counter, never written on the request path
+	view_count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['-view_count', '-created_at'], name='book_popularity_idx'),
+			models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+		]
 
 	def __str__(self):
 		return f"{self.name} by {self.author}"
 
 
+class BookTombstone(models.Model):
+	"""Marker left behind when a Book is deleted, so /api/books/changes/ can report the delete."""
+	book_id = models.BigIntegerField()
+	deleted_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['deleted_at', 'id'], name='booktombstone_deleted_idx'),
+		]
+
+	def __str__(self):
+		return f'Book {self.book_id} deleted at {self.deleted_at}'
+
+
 class ContactMessage(models.Model):
 	sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
 	recipient = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
@@ -38,10 +66,144 @@ class ContactMessage(models.Model):
 		return f"Message from {self.sender} to {self.recipient} about {self.book}"
 
 
+# Preset dictionary for archived message bodies. Contact messages are short, so plain zlib
+# spends more on its header and Huffman tables than it saves; seeding the compressor with
+# phrases buyers and sellers actually write lets even a one-line message shrink. Phrases
+# used most often go last, where back-references are cheapest. Archived rows record which
+# dictionary they were written with, so never edit this one: add _MESSAGE_ZDICT_V2 instead.
+_MESSAGE_ZDICT_V1 = (
+	b'textbook edition isbn paperback hardcover chapter notes highlighted semester course '
+	b'campus library pickup meet delivery shipping cash payment transfer discount lower offer '
+	b'would you take final price negotiable? is the price still the same? '
+	b'Are there any markings, highlights or missing pages? What condition is it in? '
+	b'Can we meet on campus tomorrow? When are you available? Where can we meet? '
+	b'Thank you! Thanks, Hi, I am interested in buying your book. '
+	b'Hello, is this book still available? Hi, is this book still available?'
+)
+_MESSAGE_FORMAT_PLAIN = b'\x00'
+_MESSAGE_FORMAT_ZDICT_V1 = b'\x01'
+
+
+def pack_message(text):
+	"""Compress a message body for cold storage; returns bytes tagged with their format."""
+	raw = text.encode('utf-8')
+	compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=_MESSAGE_ZDICT_V1)
+	packed = compressor.compress(raw) + compressor.flush()
+	if len(packed) < len(raw):
+		return _MESSAGE_FORMAT_ZDICT_V1 + packed
+	return _MESSAGE_FORMAT_PLAIN + raw
+
+
+def unpack_message(data):
+	data = bytes(data)
+	marker, body = data[:1], data[1:]
+	if marker == _MESSAGE_FORMAT_ZDICT_V1:
+		decompressor = zlib.decompressobj(-15, zdict=_MESSAGE_ZDICT_V1)
+		return (decompressor.decompress(body) + decompressor.flush()).decode('utf-8')
+	if marker == _MESSAGE_FORMAT_PLAIN:
+		return body.decode('utf-8')
+	raise ValueError(f'unknown archived message format {marker!r}')
+
+
+class ArchivedContactMessage(models.Model):
+	"""Cold copy of a ContactMessage moved out of the hot table by `archive_messages`.
+
+	Keeps the original primary key and stores the message body compressed with
+	`pack_message`.
+	"""
+	id = models.BigIntegerField(primary_key=True)
+	sender = models.ForeignKey(User, related_name='archived_sent_messages', on_delete=models.CASCADE)
+	recipient = models.ForeignKey(User, related_name='archived_received_messages', on_delete=models.CASCADE)
+	book = models.ForeignKey(Book, related_name='archived_messages', on_delete=models.CASCADE)
+	compressed_message = models.BinaryField()
+	created_at = models.DateTimeField(db_index=True)
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	@classmethod
+	def from_message(cls, cm):
+		return cls(
+			id=cm.id,
+			sender_id=cm.sender_id,
+			recipient_id=cm.recipient_id,
+			book_id=cm.book_id,
+			compressed_message=pack_message(cm.message),
+			created_at=cm.created_at,
+		)
+
+	@property
+	def message(self):
+		return unpack_message(self.compressed_message)
+
+	def __str__(self):
+		return f"Archived message from {self.sender} to {self.recipient} about {self.book}"
+
+
+def _upsert(model, values, increment=None):
+	"""Insert one (user, book) row, resolving a unique conflict in the same statement.
+
+	`values` maps column -> value. book_id is selected from the book table, so a missing
+	book inserts nothing instead of raising. On conflict the `increment` column is bumped
+	by the new value. Every add writes last_add_created: true on insert, false on conflict,
+	which is how the caller learns which of the two happened.
+	Returns the row as a model instance, or None if the book does not exist. SQLite and
+	PostgreSQL hand the row back via RETURNING; MySQL has no RETURNING for upserts, so
+	there it is read back, under the upsert's row lock, in the same transaction.
+	"""
+	qn = connection.ops.quote_name
+	table = qn(model._meta.db_table)
+	book_table = qn(Book._meta.db_table)
+	values = dict(values, last_add_created=True)
+	columns = list(values)
+	select = ', '.join(f'{book_table}.{qn("id")}' if c == 'book_id' else '%s' for c in columns)
+	params = [values[c] for c in columns if c != 'book_id'] + [values['book_id']]
+	sql = (
+		f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}) '
+		f'SELECT {select} FROM {book_table} WHERE {book_table}.{qn("id")} = %s'
+	)
+	flag = qn('last_add_created')
+	if connection.vendor == 'mysql':
+		updates = [f'{flag} = FALSE']
+		if increment:
+			col = qn(increment)
+			updates.append(f'{col} = {table}.{col} + VALUES({col})')
+		# One transaction, so the row lock the upsert takes is held through the read-back: a
+		# concurrent add for the same pair waits, and can't flip last_add_created to false
+		# between our write and our read (both callers would then report "already existed").
+		with transaction.atomic(), connection.cursor() as cursor:
+			cursor.execute(sql + ' ON DUPLICATE KEY UPDATE ' + ', '.join(updates), params)
+			if not cursor.rowcount:
+				return None
+			return model._base_manager.select_for_update().get(user_id=values['user_id'], book_id=values['book_id'])
+	updates = [f'{flag} = FALSE']
+	if increment:
+		col = qn(increment)
+		updates.append(f'{col} = {table}.{col} + excluded.{col}')
+	sql += f' ON CONFLICT ({qn("user_id")}, {qn("book_id")}) DO UPDATE SET {", ".join(updates)} RETURNING *'
+	rows = list(model._base_manager.raw(sql, params))
+	return rows[0] if rows else None
+
+
+class FavoriteManager(models.Manager):
+	def add(self, user, book_id):
+		"""Favorite a book in one statement; returns (favorite, created) or (None, False) if the book is missing."""
+		now = self.model._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+		favorite = _upsert(self.model, {'user_id': user.pk, 'book_id': book_id, 'created_at': now})
+		if favorite is None:
+			return None, False
+		if favorite.last_add_created:
+			# raw SQL skips post_save, so keep the seller summary in step here
+			BookStats.bump(book_id, favorites=1)
+		return favorite, favorite.last_add_created
+
+
 class Favorite(models.Model):
 	user = models.ForeignKey(User, related_name='favorites', on_delete=models.CASCADE)
 	book = models.ForeignKey(Book, related_name='favorited_by', on_delete=models.CASCADE)
 	created_at = models.DateTimeField(auto_now_add=True)
+	# written by FavoriteManager.add: true if that add inserted the row, false if it already existed
+	last_add_created = models.BooleanField(default=True, editable=False)
+
+	objects = FavoriteManager()
 
 	class Meta:
 		unique_together = ('user', 'book')
@@ -58,14 +220,122 @@ class Profile(models.Model):
 		return f'{self.user.username} Profile'
 
 
+class CartManager(models.Manager):
+	def add(self, user, book_id, quantity=1):
+		"""Add `quantity` of a book to the user's cart, incrementing atomically if it is already there.
+
+		Returns the cart row, or None if the book does not exist.
+		"""
+		now = self.model._meta.get_field('added_at').get_db_prep_value(timezone.now(), connection)
+		values = {'user_id': user.pk, 'book_id': book_id, 'quantity': quantity, 'added_at': now}
+		cart_item = _upsert(self.model, values, increment='quantity')
+		if cart_item is not None and cart_item.last_add_created:
+			# raw SQL skips post_save, so keep the seller summary in step here
+			BookStats.bump(book_id, cart_interest=1)
+		return cart_item
+
+
 class Cart(models.Model):
 	user = models.ForeignKey(User, on_delete=models.CASCADE)
 	book = models.ForeignKey(Book, on_delete=models.CASCADE)
 	quantity = models.PositiveIntegerField(default=1)
 	added_at = models.DateTimeField(auto_now_add=True)
+	# written by CartManager.add: true if that add inserted the row, false if it incremented it
+	last_add_created = models.BooleanField(default=True, editable=False)
+
+	objects = CartManager()
 
 	class Meta:
 		unique_together = ('user', 'book')
 
 	def __str__(self):
-		return f'{self.user.username} cart: {self.book.name}' 
+		return f'{self.user.username} cart: {self.book.name}'
+
+
+class SellerStats(models.Model):
+	"""Per-seller totals behind /api/me/seller-stats/, kept current by BookStats.bump."""
+	seller = models.OneToOneField(User, primary_key=True, related_name='seller_stats', on_delete=models.CASCADE)
+	listings = models.IntegerField(default=0)
+	favorites = models.IntegerField(default=0)
+	messages = models.IntegerField(default=0)
+	cart_interest = models.IntegerField(default=0)
+
+	def __str__(self):
+		return f'{self.seller.username} seller stats'
+
+
+class BookStats(models.Model):
+	"""Per-book counters: favorites received, messages received and carts holding the book."""
+	book = models.OneToOneField(Book, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+	seller = models.ForeignKey(User, related_name='book_stats', on_delete=models.CASCADE)
+	favorites = models.IntegerField(default=0)
+	messages = models.IntegerField(default=0)
+	cart_interest = models.IntegerField(default=0)
+
+	class Meta:
+		# serves the seller's keyset-paginated per-book listing
+		indexes = [models.Index(fields=['seller', '-book'], name='bookstats_seller_book_idx')]
+
+	def __str__(self):
+		return f'{self.book.name} stats'
+
+	@classmethod
+	def bump(cls, book_id, owner_id=None, listings=0, **deltas):
+		"""Apply counter deltas to a book's row and its seller's totals with F() updates.
+
+		Without `owner_id` the seller is looked up in a subquery rather than by loading the book.
+		"""
+		if deltas:
+			cls.objects.filter(book_id=book_id).update(**{k: models.F(k) + v for k, v in deltas.items()})
+		seller_deltas = dict(deltas, listings=listings) if listings else deltas
+		if seller_deltas:
+			if owner_id is not None:
+				sellers = SellerStats.objects.filter(seller_id=owner_id)
+			else:
+				sellers = SellerStats.objects.filter(seller_id__in=Book.objects.filter(pk=book_id).values('owner_id'))
+			sellers.update(**{k: models.F(k) + v for k, v in seller_deltas.items()})
+
+
+class SavedSearch(models.Model):
+	"""A user's standing search; new listings are matched against it by api.percolator."""
+	user = models.ForeignKey(User, related_name='saved_searches', on_delete=models.CASCADE)
+	query = models.CharField(max_length=255, blank=True)
+	category = models.CharField(max_length=100, blank=True)
+	max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+	# normalized query words, all of which must appear in a matching book
+	terms = models.CharField(max_length=255, blank=True, editable=False)
+	# the single inverted-index key this search is filed under (see api.percolator.index_key)
+	index_key = models.CharField(max_length=120, db_index=True, editable=False)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def refresh_index(self):
+		"""Recompute terms/index_key from the query; call before bulk_create, save() does it itself."""
+		from .percolator import index_key, tokenize
+		self.terms = ' '.join(sorted(set(tokenize(self.query))))
+		self.index_key = index_key(self)
+
+	def save(self, *args, **kwargs):
+		self.refresh_index()
+		super().save(*args, **kwargs)
+
+	def __str__(self):
+		return f'{self.user.username} search: {self.query or self.category or "*"}'
+
+
+class SearchAlert(models.Model):
+	"""Queued notification that a new listing matched a saved search; delivered_at is set once sent."""
+	saved_search = models.ForeignKey(SavedSearch, related_name='alerts', on_delete=models.CASCADE)
+	user = models.ForeignKey(User, related_name='search_alerts', on_delete=models.CASCADE)
+	book = models.ForeignKey(Book, related_name='search_alerts', on_delete=models.CASCADE)
+	created_at = models.DateTimeField(auto_now_add=True)
+	delivered_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		unique_together = ('saved_search', 'book')
+		indexes = [
+			models.Index(fields=['user', '-created_at'], name='searchalert_user_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.book.name} matched {self.saved_search}'
+
@@ -0,0 +1,62 @@
+"""Match newly listed books against saved searches ("percolation").
+
+Each SavedSearch is filed under exactly one key in an inverted index (SavedSearch.index_key):
+its longest query word, else "category:<name>" for category-only searches, else "*". For a new
+book we build the set of keys it could satisfy and fetch only the searches filed under those
+keys with one indexed IN query, then check the remaining conditions in Python.
+"""
+import re
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import SavedSearch, SearchAlert
+
+WILDCARD = '*'
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def index_key(search):
+    terms = search.terms.split()
+    if terms:
+        # longest word as a cheap proxy for the most selective one
+        return max(terms, key=lambda t: (len(t), t))[:120]
+    if search.category:
+        return f'category:{search.category.lower()}'[:120]
+    return WILDCARD
+
+
+def book_keys(book):
+    words = set(tokenize(book.name)) | set(tokenize(book.author)) | set(tokenize(book.category))
+    keys = {w[:120] for w in words}
+    if book.category:
+        keys.add(f'category:{book.category.lower()}'[:120])
+    keys.add(WILDCARD)
+    return keys, words
+
+
+def matches(search, book, words):
+    if search.category and search.category.lower() != (book.category or '').lower():
+        return False
+    if search.max_price is not None and Decimal(str(book.price)) > search.max_price:
+        return False
+    return all(term in words for term in search.terms.split())
+
+
+def match_book(book):
+    """Saved searches (other than the seller's own) that the book satisfies."""
+    keys, words = book_keys(book)
+    candidates = SavedSearch.objects.filter(index_key__in=keys).exclude(user_id=book.owner_id)
+    return [s for s in candidates if matches(s, book, words)]
+
+
+def queue_alerts(book):
+    """Record a SearchAlert for every saved search the new book matches; returns how many."""
+    alerts = [SearchAlert(saved_search=s, user_id=s.user_id, book=book) for s in match_book(book)]
+    if alerts:
+        with transaction.atomic():
+            SearchAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+    return len(alerts)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Book, ContactMessage, Favorite, Cart
+from . import images
+from .models import Book, ContactMessage, ArchivedContactMessage, Favorite, Cart, SavedSearch, SearchAlert
 
 User = get_user_model()
 
@@ -14,6 +15,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'book_count', 'phone']
 
     def get_book_count(self, obj):
+        # bulk endpoints may precompute this to avoid one COUNT per owner
+        if hasattr(obj, 'prefetched_book_count'):
+            return obj.prefetched_book_count
         return obj.books.count()
 
     def get_phone(self, obj):
@@ -26,11 +30,17 @@ class UserSerializer(serializers.ModelSerializer):
 class BookSerializer(serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     image = serializers.URLField(required=False)
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = ['id', 'name', 'author', 'category', 'condition', 'price', 'description', 'image', 'owner', 'created_at']
-        read_only_fields = ['owner', 'created_at']
+        fields = ['id', 'name', 'author', 'category', 'condition', 'price', 'description', 'image', 'owner', 'created_at', 'updated_at', 'view_count', 'thumbnails']
+        read_only_fields = ['owner', 'created_at', 'updated_at', 'view_count']
+
+    def get_thumbnails(self, obj):
+        if not obj.image_digest:
+            return None
+        return {size: images.thumbnail_url(obj.image_digest, size) for size in images.sizes()}
 
 
 class ContactMessageSerializer(serializers.ModelSerializer):
@@ -42,6 +52,20 @@ class ContactMessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'sender', 'recipient', 'book', 'message', 'created_at']
 
 
+class ArchivedContactMessageSerializer(serializers.ModelSerializer):
+    sender = UserSerializer(read_only=True)
+    recipient = UserSerializer(read_only=True)
+    message = serializers.CharField(read_only=True)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedContactMessage
+        fields = ['id', 'sender', 'recipient', 'book', 'message', 'created_at', 'archived']
+
+    def get_archived(self, obj):
+        return True
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     book = BookSerializer(read_only=True)
 
@@ -58,3 +82,24 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'book', 'quantity', 'added_at']
         read_only_fields = ['added_at']
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedSearch
+        fields = ['id', 'query', 'category', 'max_price', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate(self, attrs):
+        if not (attrs.get('query', '').strip() or attrs.get('category', '').strip() or attrs.get('max_price') is not None):
+            raise serializers.ValidationError('Provide a query, category or max_price')
+        return attrs
+
+
+class SearchAlertSerializer(serializers.ModelSerializer):
+    book = BookSerializer(read_only=True)
+
+    class Meta:
+        model = SearchAlert
+        fields = ['id', 'saved_search', 'book', 'created_at', 'delivered_at']
+
@@ -1,8 +1,11 @@
-from django.db.models.signals import post_save
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import ContactMessage
+from .models import ContactMessage, Book, BookTombstone, Favorite, Cart, SellerStats, BookStats
 
 
 @receiver(post_save, sender=ContactMessage)
@@ -20,3 +23,82 @@ def send_contact_email(sender, instance, created, **kwargs):
     except Exception:
         # avoid crashing on email issues in dev; logging could be added
         pass
+
+
+# Seller summary maintenance. Favorite.objects.add / Cart.objects.add write with raw SQL
+# and bump the counters themselves; these receivers cover ordinary ORM saves and deletes.
+
+@receiver(post_save, sender=Book)
+def book_stats_on_create(sender, instance, created, **kwargs):
+    if not created:
+        return
+    SellerStats.objects.get_or_create(seller_id=instance.owner_id)
+    BookStats.objects.get_or_create(book=instance, defaults={'seller_id': instance.owner_id})
+    BookStats.bump(instance.pk, instance.owner_id, listings=1)
+
+
+@receiver(post_delete, sender=Book)
+def book_stats_on_delete(sender, instance, **kwargs):
+    # favorites, carts and messages cascade first and decrement themselves
+    BookStats.bump(instance.pk, instance.owner_id, listings=-1)
+
+
+@receiver(post_save, sender=Book)
+def book_saved_search_alerts(sender, instance, created, **kwargs):
+    if created:
+        from .percolator import queue_alerts
+        queue_alerts(instance)
+
+
+@receiver(post_delete, sender=Book)
+def book_tombstone_on_delete(sender, instance, **kwargs):
+    # lets delta-sync clients (/api/books/changes/) drop the book from their cache
+    BookTombstone.objects.create(book_id=instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_stats_on_create(sender, instance, created, **kwargs):
+    if created:
+        BookStats.bump(instance.book_id, favorites=1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_stats_on_delete(sender, instance, **kwargs):
+    BookStats.bump(instance.book_id, favorites=-1)
+
+
+@receiver(post_save, sender=Cart)
+def cart_stats_on_create(sender, instance, created, **kwargs):
+    if created:
+        BookStats.bump(instance.book_id, cart_interest=1)
+
+
+@receiver(post_delete, sender=Cart)
+def cart_stats_on_delete(sender, instance, **kwargs):
+    BookStats.bump(instance.book_id, cart_interest=-1)
+
+
+@receiver(post_save, sender=ContactMessage)
+def message_stats_on_create(sender, instance, created, **kwargs):
+    if created:
+        BookStats.bump(instance.book_id, messages=1)
+
+
+_archiving = threading.local()
+
+
+@contextmanager
+def archiving_messages():
+    """Deletes inside this block are moves to cold storage: archived messages still count as received."""
+    _archiving.active = True
+    try:
+        yield
+    finally:
+        _archiving.active = False
+
+
+@receiver(post_delete, sender=ContactMessage)
+def message_stats_on_delete(sender, instance, **kwargs):
+    if getattr(_archiving, 'active', False):
+        return
+    BookStats.bump(instance.book_id, messages=-1)
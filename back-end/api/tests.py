@@ -1,3 +1,721 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, models
+from django.db.backends.signals import connection_created
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import batch, bulkhead, images, middleware, view_counter, warmup
+from .models import (
+    ArchivedContactMessage, Book, BookStats, BookTombstone, Cart, ContactMessage, Favorite, SavedSearch, SearchAlert,
+    pack_message, unpack_message,
+)
+
+User = get_user_model()
+
+
+def setUpModule():
+    # no background view-count flusher: it would race ViewCounterTests for the buffer
+    override = override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0)
+    override.enable()
+    unittest.addModuleCleanup(override.disable)
+
+
+class CartFavoriteUpsertTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Calculus', author='Stewart', price=20, owner=self.seller)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_cart_add_increments_existing_row(self):
+        self.client.post('/api/cart/', {'book': self.book.pk, 'quantity': 2}, format='json')
+        res = self.client.post('/api/cart/', {'book': self.book.pk, 'quantity': 3}, format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['quantity'], 5)
+        self.assertEqual(Cart.objects.get(user=self.buyer, book=self.book).quantity, 5)
+
+    def test_cart_add_missing_book(self):
+        res = self.client.post('/api/cart/', {'book': 9999}, format='json')
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_favorite_add_is_idempotent(self):
+        first = self.client.post('/api/favorites/', {'book': self.book.pk}, format='json')
+        second = self.client.post('/api/favorites/', {'book': self.book.pk}, format='json')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_favorite_add_missing_book(self):
+        res = self.client.post('/api/favorites/', {'book': 9999}, format='json')
+        self.assertEqual(res.status_code, 404)
+
+    def test_repeat_add_is_one_statement(self):
+        first = Cart.objects.add(self.buyer, self.book.pk, 2)
+        self.assertTrue(first.last_add_created)
+        with self.assertNumQueries(1):
+            again = Cart.objects.add(self.buyer, self.book.pk, 1)
+        self.assertEqual((again.pk, again.quantity, again.last_add_created), (first.pk, 3, False))
+        favorite, created = Favorite.objects.add(self.buyer, self.book.pk)
+        self.assertTrue(created)
+        with self.assertNumQueries(1):
+            self.assertEqual(Favorite.objects.add(self.buyer, self.book.pk), (favorite, False))
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Physics', author='Halliday', price=15, owner=seller)
+
+    def _add(self, _):
+        try:
+            client = APIClient()
+            client.force_authenticate(self.buyer)
+            client.post('/api/cart/', {'book': self.book.pk, 'quantity': 1}, format='json')
+            client.post('/api/favorites/', {'book': self.book.pk}, format='json')
+        finally:
+            connection.close()
+
+    def test_concurrent_adds_are_not_lost(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(self._add, range(40)))
+        self.assertEqual(Cart.objects.get(user=self.buyer, book=self.book).quantity, 40)
+        self.assertEqual(Favorite.objects.filter(user=self.buyer, book=self.book).count(), 1)
+
+    def test_exactly_one_concurrent_first_add_is_created(self):
+        # on MySQL this exercises the upsert + locked read-back; elsewhere RETURNING
+        def add(_):
+            try:
+                return Favorite.objects.add(self.buyer, self.book.pk)[1]
+            finally:
+                connection.close()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            created = list(pool.map(add, range(16)))
+        self.assertEqual(created.count(True), 1)
+        self.assertEqual(BookStats.objects.get(book=self.book).favorites, 1)
+
+
+class ArchiveMessagesTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Chemistry', author='Zumdahl', price=12, owner=self.seller)
+        for i in range(5):
+            cm = ContactMessage.objects.create(sender=self.buyer, recipient=self.seller, book=self.book, message=f'old {i}')
+            ContactMessage.objects.filter(pk=cm.pk).update(created_at=timezone.now() - timedelta(days=400 + i))
+        ContactMessage.objects.create(sender=self.buyer, recipient=self.seller, book=self.book, message='new')
+
+    def test_old_messages_are_moved_in_batches(self):
+        call_command('archive_messages', days=365, batch_size=2, stdout=StringIO())
+        self.assertEqual(list(ContactMessage.objects.values_list('message', flat=True)), ['new'])
+        self.assertEqual(ArchivedContactMessage.objects.count(), 5)
+        self.assertEqual(sorted(m.message for m in ArchivedContactMessage.objects.all()), [f'old {i}' for i in range(5)])
+
+    def test_short_messages_do_not_grow(self):
+        for text in ['ok', 'Hi, is this book still available?', 'Can we meet on campus tomorrow? I can pay cash.']:
+            packed = pack_message(text)
+            self.assertEqual(unpack_message(packed), text)
+            self.assertLessEqual(len(packed), len(text.encode('utf-8')) + 1)
+        self.assertLess(len(pack_message('Hello, is this book still available?')), 10)
+        with self.assertRaises(ValueError):
+            unpack_message(b'\x7fgarbage')
+
+    def test_inbox_reads_through_to_archive_only_when_asked(self):
+        call_command('archive_messages', days=365, stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        hot = client.get('/api/messages/', {'inbox': 'true'})
+        self.assertEqual(hot.data['count'], 1)
+        merged = client.get('/api/messages/', {'inbox': 'true', 'archived': 'true'})
+        self.assertEqual(merged.data['count'], 6)
+        self.assertEqual([m['message'] for m in merged.data['results']], ['new'] + [f'old {i}' for i in range(5)])
+
+
+class WarmUpTests(TransactionTestCase):
+    def test_warm_up_reports_each_step(self):
+        timings = warmup.warm_up()
+        self.assertEqual(set(timings), {'url_resolver', 'serializers', 'first_request', 'db_connect'})
+
+    def test_database_down_does_not_stop_warm_up(self):
+        with mock.patch.object(connection, 'ensure_connection', side_effect=OperationalError('down')):
+            with self.assertLogs('api.warmup', 'WARNING'):
+                self.assertIn('db_connect', warmup.warm_up())
+
+    def test_coldstart_profile_json(self):
+        out = StringIO()
+        call_command('coldstart_profile', '--json', '--path', '/api/test/', '--top', '3', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['timings']['first_request_status'], 200)
+        self.assertLessEqual(len(report['imports']), 3)
+        self.assertIn('django_setup', report['timings'])
+
+    def test_coldstart_profile_reports_probe_failure(self):
+        failed = mock.Mock(returncode=3, stdout='', stderr='Traceback: boom')
+        with mock.patch('subprocess.run', return_value=failed), self.assertRaises(CommandError) as ctx:
+            call_command('coldstart_profile', stdout=StringIO())
+        self.assertEqual((str(ctx.exception), ctx.exception.returncode), ('Traceback: boom', 3))
+
+
+class SellerStatsTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Biology', author='Campbell', price=30, owner=self.seller)
+        Book.objects.create(name='Algebra', author='Lang', price=25, owner=self.seller)
+        self.client = APIClient()
+
+    def _stats(self):
+        self.client.force_authenticate(self.seller)
+        return self.client.get('/api/me/seller-stats/').data
+
+    def _book_rows(self):
+        self.client.force_authenticate(self.seller)
+        return self.client.get('/api/me/seller-stats/books/').data['results']
+
+    def test_counters_follow_favorites_carts_and_messages(self):
+        self.client.force_authenticate(self.buyer)
+        self.client.post('/api/favorites/', {'book': self.book.pk}, format='json')
+        self.client.post('/api/favorites/', {'book': self.book.pk}, format='json')
+        self.client.post('/api/cart/', {'book': self.book.pk, 'quantity': 1}, format='json')
+        self.client.post('/api/cart/', {'book': self.book.pk, 'quantity': 2}, format='json')
+        ContactMessage.objects.create(sender=self.buyer, recipient=self.seller, book=self.book, message='hi')
+        stats = self._stats()
+        self.assertEqual((stats['listings'], stats['favorites'], stats['messages'], stats['cart_interest']), (2, 1, 1, 1))
+        row = next(b for b in self._book_rows() if b['book'] == self.book.pk)
+        self.assertEqual((row['favorites'], row['messages'], row['cart_interest']), (1, 1, 1))
+
+        Favorite.objects.filter(user=self.buyer).delete()
+        self.book.delete()
+        stats = self._stats()
+        self.assertEqual((stats['listings'], stats['favorites'], stats['messages'], stats['cart_interest']), (1, 0, 0, 0))
+        self.assertEqual(len(self._book_rows()), 1)
+
+    def test_totals_are_one_query(self):
+        self.client.force_authenticate(self.seller)
+        self.client.get('/api/me/seller-stats/')
+        with self.assertNumQueries(1):
+            self.assertNotIn('books', self.client.get('/api/me/seller-stats/').data)
+
+    @override_settings(SELLER_STATS_PAGE_SIZE=2)
+    def test_book_rows_are_keyset_paginated(self):
+        extra = Book.objects.create(name='Geometry', author='Euclid', price=5, owner=self.seller)
+        self.client.force_authenticate(self.seller)
+        first = self.client.get('/api/me/seller-stats/books/').data
+        self.assertEqual([r['book'] for r in first['results']], [extra.pk, extra.pk - 1])
+        second = self.client.get('/api/me/seller-stats/books/', {'before': first['next']}).data
+        self.assertEqual(([r['book'] for r in second['results']], second['next']), ([self.book.pk], None))
+        self.assertEqual(self.client.get('/api/me/seller-stats/books/', {'before': 'x'}).status_code, 400)
+
+    def test_archiving_keeps_message_counts_without_extra_queries(self):
+        for i in range(3):
+            cm = ContactMessage.objects.create(sender=self.buyer, recipient=self.seller, book=self.book, message=f'm{i}')
+            ContactMessage.objects.filter(pk=cm.pk).update(created_at=timezone.now() - timedelta(days=400))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('archive_messages', days=365, stdout=StringIO())
+        self.assertFalse([q for q in queries if 'api_archivedcontactmessage' in q['sql'] and 'SELECT' in q['sql']])
+        self.assertEqual(self._stats()['messages'], 3)
+        ContactMessage.objects.create(sender=self.buyer, recipient=self.seller, book=self.book, message='x').delete()
+        self.assertEqual(self._stats()['messages'], 3)
+
+    def test_rebuild_matches_incremental_counts(self):
+        Favorite.objects.create(user=self.buyer, book=self.book)
+        Cart.objects.add(self.buyer, self.book.pk, 3)
+        before = self._stats()
+        call_command('rebuild_seller_stats', stdout=StringIO())
+        self.assertEqual(self._stats(), before)
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        # drop views buffered by other tests before their rows' ids are reused here
+        view_counter.flush()
+        seller = User.objects.create_user(username='seller', password='pw')
+        self.quiet = Book.objects.create(name='Latin', author='Wheelock', price=9, owner=seller)
+        self.popular = Book.objects.create(name='Python', author='Lutz', price=40, owner=seller)
+
+    def test_zero_interval_starts_no_flusher_thread(self):
+        self.client.get(f'/api/books/{self.quiet.pk}/')
+        self.assertNotIn('view-counter-flush', [t.name for t in threading.enumerate()])
+        self.assertEqual(view_counter.flush(), 1)
+
+    def test_views_are_buffered_then_flushed_in_one_statement(self):
+        for _ in range(3):
+            self.client.get(f'/api/books/{self.popular.pk}/')
+        self.client.get(f'/api/books/{self.quiet.pk}/')
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.view_count, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(view_counter.flush(), 4)
+        self.popular.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertEqual((self.popular.view_count, self.quiet.view_count), (3, 1))
+
+        res = self.client.get('/api/books/', {'ordering': 'popular'})
+        self.assertEqual([b['id'] for b in res.json()['results']], [self.popular.pk, self.quiet.pk])
+
+
+@override_settings(BOOKS_CHANGES_BATCH_SIZE=2, BOOKS_CHANGES_OVERLAP_SECONDS=0)
+class BookChangesFeedTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.books = [Book.objects.create(name=f'Book {i}', author='A', price=5, owner=self.seller) for i in range(3)]
+
+    def _sync(self, token=None):
+        changed, deleted = [], []
+        while True:
+            res = self.client.get('/api/books/changes/', {'since': token} if token else {}).json()
+            changed += [b['id'] for b in res['changed']]
+            deleted += res['deleted']
+            token = res['next']
+            if not res['has_more']:
+                return changed, deleted, token
+
+    def test_initial_sync_then_only_deltas(self):
+        changed, deleted, token = self._sync()
+        self.assertEqual(changed, [b.pk for b in self.books])
+        self.assertEqual(deleted, [])
+
+        self.assertEqual(self._sync(token)[:2], ([], []))
+
+        self.books[0].price = 4
+        self.books[0].save()
+        gone = self.books[1].pk
+        self.books[1].delete()
+        changed, deleted, token = self._sync(token)
+        self.assertEqual((changed, deleted), ([self.books[0].pk], [gone]))
+
+    def test_bad_token(self):
+        self.assertEqual(self.client.get('/api/books/changes/', {'since': 'nope'}).status_code, 400)
+
+    def test_owner_counts_are_not_queried_per_row(self):
+        Book.objects.create(name='Other', author='B', price=5, owner=User.objects.create_user(username='other'))
+        with self.assertNumQueries(3):
+            res = self.client.get('/api/books/changes/')
+        self.assertEqual({b['owner']['book_count'] for b in res.json()['changed']}, {3})
+
+    @override_settings(BOOKS_CHANGES_OVERLAP_SECONDS=60)
+    def test_caught_up_token_rereads_recent_window(self):
+        now = timezone.now()
+        Book.objects.update(updated_at=now - timedelta(seconds=10))
+        _, _, token = self._sync()
+        late = Book.objects.create(name='Late', author='A', price=5, owner=self.seller)
+        # stamped before the rows already sent, but committed after the sync read them
+        Book.objects.filter(pk=late.pk).update(updated_at=now - timedelta(seconds=20))
+        self.assertIn(late.pk, self._sync(token)[0])
+
+    @override_settings(BOOKS_TOMBSTONE_RETENTION_DAYS=30)
+    def test_tombstones_are_pruned_and_stale_tokens_rejected(self):
+        old, recent = self.books[0].pk, self.books[1].pk
+        self.books[0].delete()
+        self.books[1].delete()
+        BookTombstone.objects.filter(book_id=old).update(deleted_at=timezone.now() - timedelta(days=31))
+        call_command('prune_book_tombstones', stdout=StringIO())
+        self.assertEqual(list(BookTombstone.objects.values_list('book_id', flat=True)), [recent])
+
+        _, _, token = self._sync()
+        with mock.patch('api.views.timezone.now', return_value=timezone.now() + timedelta(days=31)):
+            self.assertEqual(self.client.get('/api/books/changes/', {'since': token}).status_code, 410)
+
+
+class SavedSearchAlertTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.student = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_new_listing_queues_alert_for_matching_searches_only(self):
+        self.client.post('/api/saved-searches/', {'query': 'calculus', 'category': 'math', 'max_price': '30'}, format='json')
+        SavedSearch.objects.create(user=self.student, query='calculus', max_price=10)
+        SavedSearch.objects.create(user=self.student, category='physics')
+        SavedSearch.objects.create(user=self.seller, query='calculus')
+
+        book = Book.objects.create(name='Calculus: Early Transcendentals', author='Stewart', category='Math', price=25, owner=self.seller)
+        Book.objects.create(name='Linear Algebra', author='Strang', category='Math', price=20, owner=self.seller)
+
+        alerts = SearchAlert.objects.all()
+        self.assertEqual([(a.user_id, a.book_id, a.saved_search.query) for a in alerts], [(self.student.pk, book.pk, 'calculus')])
+        res = self.client.get('/api/search-alerts/', {'undelivered': 'true'})
+        self.assertEqual([a['book']['id'] for a in res.data['results']], [book.pk])
+
+    def test_acknowledged_alerts_leave_the_queue(self):
+        search = SavedSearch.objects.create(user=self.student, query='physics')
+        books = [Book.objects.create(name=f'Physics {i}', author='Serway', price=20, owner=self.seller) for i in range(3)]
+        alerts = {a.book_id: a.pk for a in SearchAlert.objects.filter(saved_search=search)}
+        res = self.client.post(f'/api/search-alerts/{alerts[books[0].pk]}/ack/')
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.data['delivered_at'])
+        res = self.client.post('/api/search-alerts/ack/', {'ids': [alerts[books[1].pk], alerts[books[0].pk]]}, format='json')
+        self.assertEqual(res.data['acknowledged'], 1)
+        queue = self.client.get('/api/search-alerts/', {'undelivered': 'true'}).data['results']
+        self.assertEqual([a['book']['id'] for a in queue], [books[2].pk])
+        self.assertEqual(self.client.post('/api/search-alerts/ack/', {}, format='json').data['acknowledged'], 1)
+        self.assertEqual(self.client.get('/api/search-alerts/', {'undelivered': 'true'}).data['count'], 0)
+        # someone else's alert is invisible, not acknowledgeable
+        other = User.objects.create_user(username='other', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post(f'/api/search-alerts/{alerts[books[2].pk]}/ack/').status_code, 404)
+
+    def test_empty_search_rejected(self):
+        res = self.client.post('/api/saved-searches/', {'query': ' '}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+
+@unittest.skipIf(images.Image is None, 'Pillow is not installed')
+class BookImageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.book = Book.objects.create(name='Atlas', author='Rand', price=10, owner=self.seller)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _upload(self):
+        buf = BytesIO()
+        images.Image.new('RGB', (1200, 1800), (200, 30, 30)).save(buf, 'PNG')
+        upload = SimpleUploadedFile('cover.png', buf.getvalue(), content_type='image/png')
+        return self.client.post(f'/api/books/{self.book.pk}/image/', {'image': upload}, format='multipart')
+
+    def test_upload_builds_small_cached_thumbnails(self):
+        res = self._upload()
+        self.assertEqual(res.status_code, 200)
+        url = res.data['thumbnails']['small']
+        thumb = self.client.get(url)
+        self.assertEqual(thumb.status_code, 200)
+        self.assertIn('immutable', thumb['Cache-Control'])
+        body = b''.join(thumb.streaming_content)
+        self.assertLess(len(body), 20000)
+        self.assertEqual(images.Image.open(BytesIO(body)).size, (160, 240))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=thumb['ETag']).status_code, 304)
+        part = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part.content, body[:10])
+        self.assertEqual(part['Content-Range'], f'bytes 0-9/{len(body)}')
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(body)}-').status_code, 416)
+
+    def test_only_owner_can_upload(self):
+        other = User.objects.create_user(username='other', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self._upload().status_code, 403)
+
+    def test_generate_thumbnails_verifies_and_marks_books_changed(self):
+        buf = BytesIO()
+        images.Image.new('RGB', (400, 600), (0, 90, 200)).save(buf, 'PNG')
+        self.book.image = 'https://covers.example.com/atlas.png'
+        self.book.save()
+        broken = Book.objects.create(name='Ghost', author='X', price=1, owner=self.seller, image='https://covers.example.com/404')
+        before = Book.objects.get(pk=self.book.pk).updated_at
+        bodies = {self.book.image: buf.getvalue(), broken.image: b'<html>Not Found</html>'}
+        with mock.patch('api.images.fetch_origin', side_effect=bodies.get):
+            call_command('generate_thumbnails', workers=1, stdout=StringIO(), stderr=StringIO())
+        self.book.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertTrue(self.book.image_digest)
+        self.assertGreater(self.book.updated_at, before)
+        self.assertEqual(broken.image_digest, '')
+        self.assertEqual(os.listdir(os.path.join(self.media, 'images', 'orig')), [self.book.image_digest[:2]])
+
+    def test_rejects_oversized_and_non_image_uploads(self):
+        with override_settings(IMAGE_MAX_BYTES=1000):
+            self.assertEqual(self._upload().status_code, 400)
+        fake = SimpleUploadedFile('cover.png', b'<svg onload=alert(1)>', content_type='image/png')
+        res = self.client.post(f'/api/books/{self.book.pk}/image/', {'image': fake}, format='multipart')
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'images')))
+
+    @override_settings(IMAGE_ORIGIN_HOSTS=['covers.example.com', '.cdn.example.org'])
+    def test_fetches_only_from_allowed_hosts(self):
+        images._check_origin('https://covers.example.com/a.jpg')
+        images._check_origin('https://img.cdn.example.org/a.jpg')
+        for url in ['http://169.254.169.254/latest/meta-data/', 'https://covers.example.com.evil.net/a.jpg',
+                    'file:///etc/passwd', 'https://example.com/a.jpg']:
+            with self.assertRaises(ValueError):
+                images._check_origin(url)
+        res = self.client.post(f'/api/books/{self.book.pk}/image/', {'url': 'http://localhost:8000/admin/'}, format='json')
+        self.assertEqual(res.status_code, 400)
+        with override_settings(IMAGE_ORIGIN_HOSTS=[]), self.assertRaises(ValueError):
+            images.fetch_origin('https://covers.example.com/a.jpg')
+
+
+class ScalableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pw', email='a@example.com')
+        self.spammer = User.objects.create_user(username='spammer', password='pw')
+        self.seller = User.objects.create_user(username='seller', password='pw')
+        self.spam = [Book.objects.create(name=f'Cheap {i}', author='X', price=1, owner=self.spammer) for i in range(3)]
+        self.book = Book.objects.create(name='Geometry', author='Euclid', price=10, owner=self.seller)
+        ContactMessage.objects.create(sender=self.seller, recipient=self.spammer, book=self.spam[0], message='is this a scam?')
+        ContactMessage.objects.create(sender=self.spammer, recipient=self.seller, book=self.book, message='still available?')
+        Favorite.objects.create(user=self.seller, book=self.spam[1])
+        self.client.force_login(self.admin)
+
+    def test_message_search_uses_full_text_index(self):
+        res = self.client.get('/admin/api/contactmessage/', {'q': 'scam'})
+        self.assertEqual([m.message for m in res.context['cl'].result_list], ['is this a scam?'])
+        res = self.client.get('/admin/api/contactmessage/', {'q': 'spammer'})
+        self.assertEqual(len(res.context['cl'].result_list), 2)
+
+    def test_keyset_next_page(self):
+        res = self.client.get('/admin/api/book/', {'before': self.spam[2].pk})
+        self.assertEqual([b.pk for b in res.context['cl'].result_list], [self.spam[1].pk, self.spam[0].pk])
+        self.assertIn(f'before={self.spam[0].pk}', res.context['keyset_next'])
+
+    def test_column_sort_ignores_keyset(self):
+        # o=2 sorts by name; a stale id cursor must not cut rows out of that order
+        res = self.client.get('/admin/api/book/', {'before': self.spam[1].pk, 'o': '2'})
+        self.assertEqual(len(res.context['cl'].result_list), 4)
+        self.assertNotIn('keyset_next', res.context)
+
+    def test_delete_owner_listings_is_set_based(self):
+        action = {'action': 'delete_owner_listings', '_selected_action': [self.spam[0].pk]}
+        confirm = self.client.post('/admin/api/book/', action)
+        self.assertEqual(confirm.status_code, 200)
+        self.assertContains(confirm, 'spammer: 3 listings')
+        self.assertEqual(Book.objects.count(), 4)
+
+        res = self.client.post('/admin/api/book/', dict(action, post='yes'))
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(list(Book.objects.values_list('pk', flat=True)), [self.book.pk])
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertEqual(sorted(BookTombstone.objects.values_list('book_id', flat=True)), sorted(b.pk for b in self.spam))
+
+    def test_delete_owner_listings_refuses_non_cascade_relations(self):
+        rel = next(r for r in Book._meta.related_objects if r.related_model is Favorite)
+        with mock.patch.object(rel, 'on_delete', models.PROTECT):
+            self.client.post('/admin/api/book/', {'action': 'delete_owner_listings', '_selected_action': [self.spam[0].pk], 'post': 'yes'})
+        self.assertEqual(Book.objects.count(), 4)
+        self.assertTrue(Favorite.objects.exists())
+
+
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        Book.objects.bulk_create(
+            Book(name=f'Book {i}', author='Author', description='Good condition. ' * 10, price=5, owner=seller)
+            for i in range(6)
+        )
+        cache.clear()
+
+    def test_gzip_round_trip_and_cached_bytes(self):
+        plain = self.client.get('/api/books/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        with mock.patch('api.middleware.compress', wraps=middleware.compress) as spy:
+            first = self.client.get('/api/books/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+            second = self.client.get('/api/books/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(spy.call_count, 1)
+
+    def test_choose_encoding(self):
+        self.assertIsNone(middleware.choose_encoding('identity'))
+        self.assertIsNone(middleware.choose_encoding('gzip;q=0'))
+        self.assertEqual(middleware.choose_encoding('deflate, gzip;q=0.5'), 'gzip')
+        # an explicit q=0 is not overridden by the wildcard
+        self.assertNotEqual(middleware.choose_encoding('gzip;q=0, *'), 'gzip')
+        self.assertIsNone(middleware.choose_encoding('gzip;q=0, br;q=0, *'))
+        self.assertIsNone(middleware.choose_encoding('*;q=0'))
+
+
+class BulkheadTests(TestCase):
+    def setUp(self):
+        caches['bulkhead'].clear()
+        self.seller = User.objects.create_user(username='seller', password='pw', email='s@example.com')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Optics', author='Hecht', price=30, owner=self.seller)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_saturated_bulkhead_sheds_only_its_routes(self):
+        limit = settings.BULKHEADS['email']['max_in_flight']
+        for _ in range(limit):
+            self.assertTrue(bulkhead.try_acquire('email'))
+        res = self.client.post('/api/messages/', {'book': self.book.pk, 'message': 'hi'}, format='json')
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], str(settings.BULKHEADS['email']['retry_after']))
+        # other routes and other methods on the same viewset are unaffected
+        self.assertEqual(self.client.get('/api/books/').status_code, 200)
+        self.assertEqual(self.client.get('/api/messages/').status_code, 200)
+
+        bulkhead.release('email')
+        res = self.client.post('/api/messages/', {'book': self.book.pk, 'message': 'hi'}, format='json')
+        self.assertEqual(res.status_code, 201)
+        stats = bulkhead.stats()['email']
+        self.assertEqual((stats['in_flight'], stats['rejected']), (limit - 1, 1))
+
+    def test_warns_when_counters_cannot_be_shared(self):
+        log = mock.Mock()
+        self.assertTrue(bulkhead.is_process_local())
+        bulkhead.warn_if_process_local(log, concurrency=1)
+        self.assertEqual(log.warning.call_count, 1)
+        bulkhead.warn_if_process_local(log, concurrency=8)
+        with mock.patch('api.bulkhead.is_process_local', return_value=False):
+            bulkhead.warn_if_process_local(log, concurrency=1)
+        self.assertEqual(log.warning.call_count, 1)
+
+    @override_settings(BULKHEAD_SLOT_TTL=60)
+    def test_counters_outlive_ttl_under_steady_load(self):
+        start = time.time()
+        with mock.patch('time.time') as clock:
+            for minute in range(5):
+                clock.return_value = start + minute * 50
+                self.assertTrue(bulkhead.try_acquire('user_listing'))
+                bulkhead.release('user_listing')
+            self.assertEqual(bulkhead.stats()['user_listing']['accepted'], 5)
+            clock.return_value = start + 4 * 50 + 61
+            self.assertEqual(bulkhead.stats()['user_listing']['accepted'], 0)
+
+
+class BatchEndpointTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        self.buyer = User.objects.create_user(username='buyer', password='pw')
+        self.book = Book.objects.create(name='Statics', author='Meriam', price=18, owner=seller)
+        Favorite.objects.create(user=self.buyer, book=self.book)
+        self.client = APIClient()
+
+    def test_sub_requests_share_the_session(self):
+        self.client.force_login(self.buyer)
+        res = self.client.post('/api/batch/', {'requests': [
+            {'id': 'me', 'path': '/api/auth/user/'},
+            {'id': 'book', 'path': f'/api/books/{self.book.pk}/'},
+            {'id': 'favorites', 'path': '/api/favorites/'},
+            {'id': 'search', 'path': '/api/books/?search=stat'},
+            {'id': 'missing', 'path': '/api/nope/'},
+            {'id': 'nested', 'path': '/api/batch/'},
+        ]}, format='json')
+        self.assertEqual(res.status_code, 200)
+        out = {r['id']: r for r in res.data['responses']}
+        self.assertEqual([r['id'] for r in res.data['responses']], ['me', 'book', 'favorites', 'search', 'missing', 'nested'])
+        self.assertEqual(out['me']['body']['username'], 'buyer')
+        self.assertEqual(out['book']['body']['name'], 'Statics')
+        self.assertEqual(out['favorites']['body']['count'], 1)
+        self.assertEqual(out['search']['body']['count'], 1)
+        self.assertEqual((out['missing']['status'], out['nested']['status']), (404, 400))
+
+    def test_anonymous_sub_requests_keep_their_permissions(self):
+        res = self.client.post('/api/batch/', {'requests': [{'path': '/api/favorites/'}, {'path': '/api/books/'}]}, format='json')
+        self.assertEqual([r['status'] for r in res.data['responses']], [403, 200])
+
+    def test_failing_sub_requests_are_reported_per_item(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        digest = 'ab' * 32
+        with override_settings(MEDIA_ROOT=media):
+            images._write_atomic(images.thumbnail_path(digest, 'small'), b'jpeg bytes')
+            with mock.patch('api.batch._close', wraps=batch._close) as close:
+                res = self.client.post('/api/batch/', {'requests': [
+                    {'id': 'thumb', 'path': f'/api/images/small/{digest}.jpg'},
+                    {'id': 'gone', 'path': f'/api/images/small/{"cd" * 32}.jpg'},
+                    {'id': 'books', 'path': '/api/books/'},
+                ]}, format='json')
+        self.assertEqual(res.status_code, 200)
+        out = {r['id']: (r['status'], r['body']) for r in res.data['responses']}
+        self.assertEqual(out['thumb'], (200, None))
+        self.assertEqual(out['gone'][0], 404)
+        self.assertEqual(out['books'][0], 200)
+        # the streamed file was released; JSON responses need no closing
+        self.assertEqual(close.call_count, 1)
+        self.assertTrue(close.call_args.args[0].file_to_stream.closed)
+
+    def test_unexpected_error_is_a_500_entry(self):
+        with mock.patch('api.batch.resolve') as resolve, self.assertLogs('api.batch', 'ERROR'):
+            resolve.return_value.func.side_effect = RuntimeError('boom')
+            resolve.return_value.args, resolve.return_value.kwargs = (), {}
+            with mock.patch('api.batch.bulkhead.route_for', return_value=None):
+                res = self.client.post('/api/batch/', {'requests': [{'id': 'x', 'path': '/api/books/'}]}, format='json')
+        self.assertEqual(res.data['responses'], [{'id': 'x', 'status': 500, 'body': {'detail': 'Internal server error'}}])
+
+
+class BatchConcurrencyTests(TransactionTestCase):
+    def test_concurrent_dispatch_returns_results_in_order(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        books = [Book.objects.create(name=f'Vol {i}', author='A', price=1, owner=seller) for i in range(5)]
+        client = APIClient()
+        res = client.post('/api/batch/', {'requests': [{'path': f'/api/books/{b.pk}/'} for b in books]}, format='json')
+        self.assertEqual([r['body']['name'] for r in res.data['responses']], [b.name for b in books])
+
+    @override_settings(BATCH_MAX_WORKERS=2)
+    def test_pool_threads_follow_conn_max_age(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        books = [Book.objects.create(name=f'Vol {i}', author='A', price=1, owner=seller) for i in range(4)]
+        opened = []
+        connection_created.connect(lambda **kwargs: opened.append(kwargs['connection']), weak=False, dispatch_uid='batch-test')
+        self.addCleanup(connection_created.disconnect, dispatch_uid='batch-test')
+        self.addCleanup(setattr, batch, '_pool', None)
+        client = APIClient()
+
+        def run_batches(max_age):
+            # pool threads build their connections from these settings, so start fresh ones
+            if batch._pool is not None:
+                batch._pool.shutdown()
+            batch._pool = None
+            opened.clear()
+            with mock.patch.dict(connections.settings['default'], CONN_MAX_AGE=max_age):
+                for _ in range(3):
+                    res = client.post('/api/batch/', {'requests': [{'path': f'/api/books/{b.pk}/'} for b in books]}, format='json')
+                    self.assertEqual([r['status'] for r in res.data['responses']], [200] * 4)
+            return len(opened)
+
+        # persistent connections are kept by each of the two threads across items and batches
+        self.assertLessEqual(run_batches(60), 2)
+        # CONN_MAX_AGE = 0 means a fresh connection per item, as for a request
+        self.assertGreaterEqual(run_batches(0), 12)
+
+
+@override_settings(BOOKS_BULK_MAX_IDS=5)
+class BookBulkLookupTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        self.books = [Book.objects.create(name=f'Book {i}', author='A', price=3, owner=seller) for i in range(3)]
+
+    def test_keeps_requested_order_and_lists_missing(self):
+        a, b, c = (book.pk for book in self.books)
+        res = self.client.get('/api/books/bulk/', {'ids': f'{c},9999,{a},{c},{b}'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([book['id'] for book in res.json()['results']], [c, a, b])
+        self.assertEqual(res.json()['missing'], [9999])
+        self.assertEqual(res.json()['results'][0]['owner']['book_count'], 3)
+
+    def test_one_query_for_books_and_one_for_owner_counts(self):
+        ids = ','.join(str(book.pk) for book in self.books)
+        with self.assertNumQueries(2):
+            self.client.get('/api/books/bulk/', {'ids': ids})
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.client.get('/api/books/bulk/', {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/books/bulk/').status_code, 400)
+        self.assertEqual(self.client.get('/api/books/bulk/', {'ids': '1,2,3,4,5,6'}).status_code, 400)
+        # duplicates count once towards the cap
+        self.assertEqual(self.client.get('/api/books/bulk/', {'ids': '1,1,1,2,3,4,5'}).status_code, 200)
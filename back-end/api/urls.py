@@ -1,12 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import test_api, BookViewSet, login_view, logout_view, current_user, get_csrf, signup_view, ContactMessageViewSet, FavoriteViewSet, CartViewSet, users_list, order_view
+from .views import test_api, BookViewSet, login_view, logout_view, current_user, get_csrf, signup_view, ContactMessageViewSet, FavoriteViewSet, CartViewSet, users_list, order_view, seller_stats, seller_book_stats, SavedSearchViewSet, SearchAlertViewSet, serve_image, bulkhead_metrics, batch_view
 
 router = DefaultRouter()
 router.register(r'books', BookViewSet, basename='book')
 router.register(r'messages', ContactMessageViewSet, basename='message')
 router.register(r'favorites', FavoriteViewSet, basename='favorite')
 router.register(r'cart', CartViewSet, basename='cart')
+router.register(r'saved-searches', SavedSearchViewSet, basename='saved-search')
+router.register(r'search-alerts', SearchAlertViewSet, basename='search-alert')
 
 urlpatterns = [
     path('test/', test_api),
@@ -17,5 +19,10 @@ urlpatterns = [
     path('auth/csrf/', get_csrf),
     path('users/', users_list),
     path('order/', order_view),
+    path('me/seller-stats/', seller_stats),
+    path('me/seller-stats/books/', seller_book_stats),
+    path('images/<str:size>/<str:digest>.jpg', serve_image),
+    path('metrics/bulkheads/', bulkhead_metrics),
+    path('batch/', batch_view),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,80 @@
+"""Write-behind view counters for book detail pages.
+
+record_view() only bumps an in-process counter; a daemon thread per worker flushes the
+buffered counts into Book.view_count every VIEW_COUNTER_FLUSH_INTERVAL seconds with a single
+UPDATE ... CASE statement. Increments are applied as view_count + n, so workers flushing
+concurrently never overwrite each other. gunicorn's worker_exit hook flushes what is left on a
+clean shutdown; a worker that is killed loses at most one interval of views. Setting the interval
+to 0 disables the thread (tests do this), leaving counts buffered until flush() is called.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, When
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_flusher_pid = None
+
+
+def record_view(book_id):
+    with _lock:
+        _pending[int(book_id)] += 1
+    _ensure_flusher()
+
+
+def flush():
+    """Write buffered counts to the database; returns the number of views flushed."""
+    from .models import Book
+
+    global _pending
+    with _lock:
+        batch, _pending = _pending, Counter()
+    if not batch:
+        return 0
+    ids = list(batch)
+    chunk = getattr(settings, 'VIEW_COUNTER_FLUSH_CHUNK', 500)
+    try:
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            Book.objects.filter(pk__in=part).update(
+                view_count=F('view_count') + Case(*[When(pk=pk, then=batch[pk]) for pk in part], default=0)
+            )
+    except Exception:
+        # put the counts back so a transient DB error doesn't drop them
+        with _lock:
+            _pending.update(batch)
+        raise
+    return sum(batch.values())
+
+
+def _run_flusher(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            close_old_connections()
+            flush()
+        except Exception:
+            logger.exception('view counter flush failed')
+
+
+def _ensure_flusher():
+    # one thread per process; a worker forked from a preloaded master starts its own
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    interval = getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+    if interval <= 0:
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_run_flusher, args=(interval,), name='view-counter-flush', daemon=True).start()
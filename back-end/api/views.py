@@ -1,25 +1,40 @@
 from django.shortcuts import render
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, Http404
+import os
+import re
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.csrf import ensure_csrf_cookie
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.authentication import SessionAuthentication
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.core.mail import send_mail
 import traceback
+import base64
+import json
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
 
-from .models import Book
+from .models import Book, BookTombstone
 from .serializers import BookSerializer, UserSerializer
-from .serializers import ContactMessageSerializer
-from .models import ContactMessage
+from .serializers import ContactMessageSerializer, ArchivedContactMessageSerializer
+from .models import ContactMessage, ArchivedContactMessage
 from .models import Favorite
 from .models import Profile
 from .models import Cart
+from .models import SellerStats, BookStats
+from .view_counter import record_view
+from . import images
+from . import bulkhead
+from . import batch
 from .serializers import FavoriteSerializer
 from .serializers import CartSerializer
+from .serializers import SavedSearchSerializer, SearchAlertSerializer
+from .models import SavedSearch, SearchAlert
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -98,6 +113,57 @@ def logout_view(request):
     return Response({'detail': 'Logged out'})
 
 
+def _encode_sync_token(cursor):
+    data = {k: [cursor[k][0].isoformat(), cursor[k][1]] if cursor[k] else None for k in ('u', 'd')}
+    # when the token was issued, so a client gone longer than tombstone retention can be told to resync
+    data['s'] = timezone.now().isoformat()
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def _decode_sync_token(token):
+    """Opaque cursor -> {'u': (updated_at, id) | None, 'd': (deleted_at, id) | None, 's': issued_at | None}."""
+    if not token:
+        return {'u': None, 'd': None, 's': None}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        cursor = {}
+        for key in ('u', 'd'):
+            value = data.get(key)
+            if value is None:
+                cursor[key] = None
+                continue
+            ts = parse_datetime(value[0])
+            if ts is None:
+                raise ValueError('bad timestamp')
+            cursor[key] = (ts, int(value[1]))
+        cursor['s'] = parse_datetime(data['s']) if data.get('s') else None
+        return cursor
+    except (TypeError, KeyError, IndexError, AttributeError, ValueError) as e:
+        raise ValueError(str(e))
+
+
+def _settled_cursor(ts, pk, horizon):
+    """Cursor after a row at (ts, pk), but never past `horizon`.
+
+    updated_at/deleted_at are stamped before commit, so a slow transaction can commit a
+    timestamp older than rows already handed out. Holding the cursor at the horizon makes
+    the next call re-read that window; clients apply changes idempotently by id.
+    """
+    if ts > horizon:
+        return (horizon, 0)
+    return (ts, pk)
+
+
+def _attach_owner_book_counts(books):
+    """Precompute each owner's listing count in one query so UserSerializer doesn't COUNT per row."""
+    owner_ids = {book.owner_id for book in books}
+    counts = dict(
+        Book.objects.filter(owner_id__in=owner_ids).values('owner_id').annotate(n=Count('id')).values_list('owner_id', 'n')
+    )
+    for book in books:
+        book.owner.prefetched_book_count = counts.get(book.owner_id, 0)
+
+
 class BookViewSet(viewsets.ModelViewSet):
     queryset = Book.objects.all().order_by('-created_at')
     serializer_class = BookSerializer
@@ -113,29 +179,192 @@ class BookViewSet(viewsets.ModelViewSet):
             qs = qs.filter(Q(name__icontains=q) | Q(author__icontains=q) | Q(category__icontains=q))
         if category:
             qs = qs.filter(category__iexact=category)
+        if self.request.query_params.get('ordering') == 'popular':
+            qs = qs.order_by('-view_count', '-created_at')
         return qs
 
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request):
+        """Books created, updated or deleted since ?since=<token>, in bounded batches.
+
+        Omit `since` for a full initial sync; then keep passing the returned `next`
+        token until `has_more` is false. Once caught up, the token trails the newest
+        changes by BOOKS_CHANGES_OVERLAP_SECONDS, so a book may be sent more than once.
+        A token older than BOOKS_TOMBSTONE_RETENTION_DAYS gets 410: deletes it would
+        need may have been pruned, so the client must start over without `since`.
+        """
+        try:
+            cursor = _decode_sync_token(request.query_params.get('since'))
+        except ValueError:
+            return Response({'detail': 'Invalid since token'}, status=status.HTTP_400_BAD_REQUEST)
+        now = timezone.now()
+        retention = timedelta(days=settings.BOOKS_TOMBSTONE_RETENTION_DAYS)
+        if cursor['s'] and cursor['s'] < now - retention:
+            return Response({'detail': 'since token expired; sync again from scratch'}, status=status.HTTP_410_GONE)
+        limit = getattr(settings, 'BOOKS_CHANGES_BATCH_SIZE', 200)
+
+        changed = Book.objects.select_related('owner', 'owner__profile').order_by('updated_at', 'id')
+        if cursor['u']:
+            ts, pk = cursor['u']
+            changed = changed.filter(Q(updated_at__gt=ts) | Q(updated_at=ts, id__gt=pk))
+        changed = list(changed[:limit + 1])
+
+        deleted = BookTombstone.objects.order_by('deleted_at', 'id')
+        if cursor['d']:
+            ts, pk = cursor['d']
+            deleted = deleted.filter(Q(deleted_at__gt=ts) | Q(deleted_at=ts, id__gt=pk))
+        deleted = list(deleted[:limit + 1])
+
+        has_more = len(changed) > limit or len(deleted) > limit
+        changed, deleted = changed[:limit], deleted[:limit]
+        # mid-sync the cursor must move past the page or a busy window would repeat forever
+        horizon = now if has_more else now - timedelta(seconds=settings.BOOKS_CHANGES_OVERLAP_SECONDS)
+        if changed:
+            cursor['u'] = _settled_cursor(changed[-1].updated_at, changed[-1].pk, horizon)
+        if deleted:
+            cursor['d'] = _settled_cursor(deleted[-1].deleted_at, deleted[-1].pk, horizon)
+        _attach_owner_book_counts(changed)
+        return Response({
+            'changed': self.get_serializer(changed, many=True).data,
+            'deleted': [t.book_id for t in deleted],
+            'next': _encode_sync_token(cursor),
+            'has_more': has_more,
+        })
+
+    @action(detail=True, methods=['post'], url_path='image')
+    def upload_image(self, request, pk=None):
+        """Store the book's image (multipart `image` file, or `url` to fetch) and build its thumbnails."""
+        book = self.get_object()
+        if book.owner_id != request.user.id:
+            return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        if images.Image is None:
+            # without Pillow an upload can be neither verified nor thumbnailed
+            return Response({'detail': 'Image support is not installed (Pillow)'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        upload = request.FILES.get('image')
+        url = request.data.get('url') or (None if upload else book.image)
+        try:
+            data = images.read_upload(upload) if upload else images.fetch_origin(url) if url else None
+        except Exception as e:
+            return Response({'detail': f'Could not fetch image: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not data:
+            return Response({'detail': 'image file or url is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            images.verify(data)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        digest = images.store_original(data)
+        try:
+            images.render_thumbnails(digest)
+        except Exception as e:
+            return Response({'detail': f'Not a usable image: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        book.image_digest = digest
+        book.save(update_fields=['image_digest', 'updated_at'])
+        return Response(self.get_serializer(book).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # buffered; written to Book.view_count by the periodic flush
+        record_view(kwargs['pk'])
+        return response
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['get'], url_path='bulk')
+    def bulk(self, request):
+        """Return several books by id in one query: /api/books/bulk/?ids=1,2,3"""
+        raw = request.query_params.get('ids', '')
+        try:
+            ids = [int(part) for part in raw.split(',') if part.strip()]
+        except ValueError:
+            return Response({'detail': 'ids must be a comma separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'detail': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        # keep the first occurrence of each id so the response follows the requested order
+        ids = list(dict.fromkeys(ids))
+        max_ids = getattr(settings, 'BOOKS_BULK_MAX_IDS', 100)
+        if len(ids) > max_ids:
+            return Response({'detail': f'At most {max_ids} ids may be requested at once'}, status=status.HTTP_400_BAD_REQUEST)
+        books = Book.objects.select_related('owner', 'owner__profile').in_bulk(ids)
+        found = [books[pk] for pk in ids if pk in books]
+        missing = [pk for pk in ids if pk not in books]
+        _attach_owner_book_counts(found)
+        serializer = self.get_serializer(found, many=True)
+        return Response({'results': serializer.data, 'missing': missing})
+
     def get_permissions(self):
         # Allow read-only for unauthenticated users, require auth to create/update/delete
         return super().get_permissions()
 
 
+class _ChainedQuerySets:
+    """Sliceable view over several querysets, read one after another.
+
+    Only slices that overlap a queryset hit the database, so paginating the hot
+    messages never touches the archive table and vice versa.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def _get_counts(self):
+        if self._counts is None:
+            self._counts = [qs.count() for qs in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self._get_counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop if key.stop is not None else self.count()
+        rows = []
+        offset = 0
+        for qs, n in zip(self.querysets, self._get_counts()):
+            lo, hi = max(start - offset, 0), min(stop - offset, n)
+            if lo < hi:
+                rows.extend(qs[lo:hi])
+            offset += n
+        return rows
+
+
 class ContactMessageViewSet(viewsets.ModelViewSet):
     serializer_class = ContactMessageSerializer
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
+    def _owner_filter(self):
         inbox = self.request.query_params.get('inbox')
         sent = self.request.query_params.get('sent')
         if inbox == 'true':
-            return ContactMessage.objects.filter(recipient=self.request.user).order_by('-created_at')
+            return {'recipient': self.request.user}
         if sent == 'true':
-            return ContactMessage.objects.filter(sender=self.request.user).order_by('-created_at')
-        return ContactMessage.objects.filter(recipient=self.request.user).order_by('-created_at')
+            return {'sender': self.request.user}
+        return {'recipient': self.request.user}
+
+    def get_queryset(self):
+        return ContactMessage.objects.filter(**self._owner_filter()).order_by('-created_at')
+
+    def list(self, request, *args, **kwargs):
+        # ?archived=true reads through to messages moved out by `manage.py archive_messages`
+        if request.query_params.get('archived') != 'true':
+            return super().list(request, *args, **kwargs)
+        archived = ArchivedContactMessage.objects.filter(**self._owner_filter()).order_by('-created_at')
+        items = _ChainedQuerySets(self.get_queryset(), archived)
+        page = self.paginate_queryset(items)
+        rows = page if page is not None else items[:]
+        data = [
+            (ArchivedContactMessageSerializer if isinstance(obj, ArchivedContactMessage) else ContactMessageSerializer)(obj).data
+            for obj in rows
+        ]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
     def create(self, request, *args, **kwargs):
         book_id = request.data.get('book')
@@ -175,11 +404,15 @@ class FavoriteViewSet(viewsets.ModelViewSet):
         if not book_id:
             return Response({'detail': 'book is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            book = Book.objects.get(pk=book_id)
-        except Book.DoesNotExist:
-            return Response({'detail': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return Response({'detail': 'book must be an integer id'}, status=status.HTTP_400_BAD_REQUEST)
         print(f"Favorite create request: user={request.user.username}, book_id={book_id}")
-        favorite, created = Favorite.objects.get_or_create(user=request.user, book=book)
+        # single INSERT ... ON CONFLICT ... RETURNING, so concurrent clicks cannot race
+        favorite, created = Favorite.objects.add(request.user, book_id)
+        if favorite is None:
+            return Response({'detail': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+        favorite.book = Book.objects.select_related('owner', 'owner__profile').get(pk=book_id)
         if not created:
             print(f"Favorite already exists: user={request.user.username}, book_id={book_id}, fav_id={favorite.id}")
             # return the existing favorite object (idempotent)
@@ -208,18 +441,195 @@ class CartViewSet(viewsets.ModelViewSet):
         if not book_id:
             return Response({'detail': 'book is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            book = Book.objects.get(pk=book_id)
-        except Book.DoesNotExist:
+            book_id = int(book_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            return Response({'detail': 'book and quantity must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({'detail': 'quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        # single INSERT ... ON CONFLICT DO UPDATE quantity = quantity + n, so concurrent adds are not lost
+        cart_item = Cart.objects.add(request.user, book_id, quantity)
+        if cart_item is None:
             return Response({'detail': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
-        cart_item, created = Cart.objects.get_or_create(user=request.user, book=book, defaults={'quantity': quantity})
-        if not created:
-            cart_item.quantity += int(quantity)
-            cart_item.save()
-        print(f"Added to cart: user={request.user.username}, book={book.name}, quantity={cart_item.quantity}")
+        cart_item.book = Book.objects.select_related('owner', 'owner__profile').get(pk=book_id)
+        print(f"Added to cart: user={request.user.username}, book={cart_item.book.name}, quantity={cart_item.quantity}")
         serializer = CartSerializer(cart_item)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    serializer_class = SavedSearchSerializer
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class SearchAlertViewSet(viewsets.ReadOnlyModelViewSet):
+    """New listings that matched one of the user's saved searches (?undelivered=true for the pending queue).
+
+    POST .../<id>/ack/ or .../ack/ marks alerts delivered, which takes them off the queue.
+    """
+    serializer_class = SearchAlertSerializer
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = SearchAlert.objects.filter(user=self.request.user).select_related('book__owner').order_by('-created_at')
+        if self.request.query_params.get('undelivered') == 'true':
+            qs = qs.filter(delivered_at__isnull=True)
+        return qs
+
+    @action(detail=True, methods=['post'])
+    def ack(self, request, pk=None):
+        """Mark one alert delivered (a no-op if it already was)."""
+        alert = self.get_object()
+        SearchAlert.objects.filter(pk=alert.pk, delivered_at__isnull=True).update(delivered_at=timezone.now())
+        alert.refresh_from_db(fields=['delivered_at'])
+        return Response(self.get_serializer(alert).data)
+
+    @action(detail=False, methods=['post'], url_path='ack')
+    def ack_many(self, request):
+        """Mark the given alert ids delivered ({"ids": [...]}), or every pending alert if ids is omitted."""
+        pending = SearchAlert.objects.filter(user=request.user, delivered_at__isnull=True)
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if ids is not None:
+            if not isinstance(ids, list):
+                return Response({'detail': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                pending = pending.filter(pk__in=[int(i) for i in ids])
+            except (TypeError, ValueError):
+                return Response({'detail': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'acknowledged': pending.update(delivered_at=timezone.now())})
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def serve_image(request, size, digest):
+    """Serve a content-addressed thumbnail with immutable caching, ETag and single-range support."""
+    if size not in images.sizes() or not re.fullmatch(r'[0-9a-f]{64}', digest):
+        raise Http404
+    path = images.thumbnail_path(digest, size)
+    if not os.path.exists(path):
+        raise Http404
+    etag = f'"{digest[:16]}-{size}"'
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={getattr(settings, "IMAGE_CACHE_MAX_AGE", 31536000)}, immutable',
+        'Accept-Ranges': 'bytes',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        for k, v in headers.items():
+            response[k] = v
+        return response
+
+    length = os.path.getsize(path)
+    match = _RANGE_RE.match(request.headers.get('Range', '').replace(' ', ''))
+    if match and (match.group(1) or match.group(2)):
+        start, end = match.groups()
+        if start:
+            start, end = int(start), min(int(end) if end else length - 1, length - 1)
+        else:
+            start, end = max(length - int(end), 0), length - 1
+        if start > end or start >= length:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{length}'
+            return response
+        with open(path, 'rb') as f:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), status=206, content_type='image/jpeg')
+        response['Content-Range'] = f'bytes {start}-{end}/{length}'
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    for k, v in headers.items():
+        response[k] = v
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([])
+def batch_view(request):
+    """Run several GET API calls in one round trip.
+
+    Body: {"requests": [{"id": "book", "path": "/api/books/3/"}, ...]}. Each sub-request runs
+    with the caller's session and its own permission checks; results come back in order as
+    {"responses": [{"id", "status", "body"}, ...]}.
+    """
+    items = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'detail': 'requests must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(items) > max_requests:
+        return Response({'detail': f'At most {max_requests} requests per batch'}, status=status.HTTP_400_BAD_REQUEST)
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return Response({'detail': 'each request must be an object with a path'}, status=status.HTTP_400_BAD_REQUEST)
+        parsed.append((item.get('id', i), item.get('path')))
+    return Response({'responses': batch.dispatch_all(request._request, parsed)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bulkhead_metrics(request):
+    """In-flight (queue depth), accepted and rejected counts per bulkhead."""
+    if not request.user.is_staff:
+        return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(bulkhead.stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_stats(request):
+    """Listing, favorite, message and cart totals for the current seller: one primary-key read of the summary table."""
+    totals = SellerStats.objects.filter(seller=request.user).first()
+    return Response({
+        'listings': totals.listings if totals else 0,
+        'favorites': totals.favorites if totals else 0,
+        'messages': totals.messages if totals else 0,
+        'cart_interest': totals.cart_interest if totals else 0,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_book_stats(request):
+    """Per-book counters for the current seller, newest listing first.
+
+    Keyset paginated: pass the previous response's `next` as `?before=` to continue.
+    """
+    limit = settings.SELLER_STATS_PAGE_SIZE
+    rows = BookStats.objects.filter(seller=request.user).select_related('book').order_by('-book_id')
+    before = request.query_params.get('before')
+    if before:
+        try:
+            rows = rows.filter(book_id__lt=int(before))
+        except ValueError:
+            return Response({'detail': 'before must be a book id'}, status=status.HTTP_400_BAD_REQUEST)
+    rows = list(rows[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return Response({
+        'results': [
+            {
+                'book': s.book_id,
+                'name': s.book.name,
+                'favorites': s.favorites,
+                'messages': s.messages,
+                'cart_interest': s.cart_interest,
+            }
+            for s in rows
+        ],
+        'next': rows[-1].book_id if more else None,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def order_view(request):
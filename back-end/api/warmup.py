@@ -0,0 +1,65 @@
+"""Pre-fork warm-up so new workers don't pay for lazy initialisation on their first request.
+
+Opt-in: gunicorn.conf.py calls it from on_starting when preload_app is set, so it runs once
+in the master after the app is loaded and every forked worker inherits the warmed state.
+Importing backend.wsgi alone (runserver, tests, other servers) never triggers it.
+"""
+import logging
+import time
+
+from django.db import DatabaseError, connections
+from django.test import Client
+from django.urls import get_resolver
+from rest_framework.serializers import ModelSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(verbose=False):
+    timings = {}
+
+    start = time.perf_counter()
+    resolver = get_resolver()
+    # populating reverse_dict compiles every pattern, including the router's viewset routes
+    resolver.reverse_dict
+    timings['url_resolver'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from . import serializers
+    for name in dir(serializers):
+        cls = getattr(serializers, name)
+        if isinstance(cls, type) and issubclass(cls, ModelSerializer) and cls.__module__ == serializers.__name__:
+            # building .fields walks the model and caches field mappings on first use
+            cls().fields
+    timings['serializers'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # one request through the full middleware/DRF stack imports everything loaded lazily on first use
+    Client().get('/api/test/', SERVER_NAME='localhost')
+    timings['first_request'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        for conn in connections.all():
+            conn.ensure_connection()
+    except DatabaseError as exc:
+        # a database that is down at boot must not stop the server starting; workers retry in post_fork
+        logger.warning('warm-up could not connect to the database: %s', exc)
+    # don't let forked workers share the master's sockets; each worker reconnects in post_fork
+    connections.close_all()
+    timings['db_connect'] = time.perf_counter() - start
+
+    if verbose:
+        for step, seconds in timings.items():
+            print(f'warm-up {step}: {seconds * 1000:.1f} ms')
+    return timings
+
+
+def connect_worker():
+    """Open this worker's DB connections before it accepts traffic (gunicorn post_fork)."""
+    try:
+        for conn in connections.all():
+            conn.ensure_connection()
+    except DatabaseError as exc:
+        # Django reconnects on the first query, so just note it and let the worker start
+        logger.warning('worker could not connect to the database: %s', exc)
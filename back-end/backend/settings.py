@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.bulkhead.BulkheadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -117,6 +119,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # file-backed test db: the shared-cache in-memory default raises "table is locked"
+        # instead of waiting when the concurrency tests write from several threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -178,6 +183,16 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Thumbnails generated by api.images (bounding boxes, width x height)
+THUMBNAIL_SIZES = {'small': (160, 240), 'medium': (320, 480)}
+THUMBNAIL_QUALITY = 80
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+# Hosts book image URLs may be fetched from (comma separated; '.example.com' also allows subdomains).
+# Empty disables fetching, so user-supplied URLs can't be used to reach internal services.
+IMAGE_ORIGIN_HOSTS = [h.strip() for h in os.environ.get('IMAGE_ORIGIN_HOSTS', '').split(',') if h.strip()]
+# Processes per worker that resize uploads off the request thread; 0 renders inline
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -192,6 +207,60 @@ REST_FRAMEWORK = {
 REST_FRAMEWORK.setdefault('DEFAULT_PAGINATION_CLASS', 'rest_framework.pagination.PageNumberPagination')
 REST_FRAMEWORK.setdefault('PAGE_SIZE', 6)
 
+# api.middleware.CompressionMiddleware: brotli when installed, else gzip; levels tuned for latency
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 5
+COMPRESSION_BROTLI_QUALITY = 4
+# compressed bodies of cacheable GETs are kept (keyed by body hash) for this many seconds
+COMPRESSION_CACHE_TIMEOUT = 300
+
+# api.bulkhead: max in-flight requests per group of slow views; extra requests get 503 + Retry-After.
+# Views are named 'function_view' or 'ViewSetClass.action'.
+# Counters expire BULKHEAD_SLOT_TTL seconds after their last acquire/release (default 300).
+# The counters must be shared by every worker: a gunicorn sync worker serves one request at a time,
+# so a per-process count never passes 1 and no limit would ever trip. Set REDIS_URL (needs the
+# `redis` package) in production; without it gunicorn.conf.py warns at startup.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'bulkhead': (
+        {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}
+        if os.environ.get('REDIS_URL')
+        else {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bulkhead'}
+    ),
+}
+BULKHEAD_CACHE_ALIAS = 'bulkhead'
+BULKHEADS = {
+    'email': {'max_in_flight': 4, 'retry_after': 10, 'views': ['order_view', 'ContactMessageViewSet.create']},
+    'auth': {'max_in_flight': 8, 'retry_after': 2, 'views': ['login_view', 'signup_view']},
+    'user_listing': {'max_in_flight': 2, 'retry_after': 5, 'views': ['users_list']},
+}
+
+# /api/batch/: max GET sub-requests per call, and threads used to run them concurrently
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Upper bound on how many ids a single /api/books/bulk/ call may request
+BOOKS_BULK_MAX_IDS = int(os.environ.get('BOOKS_BULK_MAX_IDS', 100))
+
+# Page size of /api/me/seller-stats/books/
+SELLER_STATS_PAGE_SIZE = int(os.environ.get('SELLER_STATS_PAGE_SIZE', 50))
+
+# Maximum changed (and, separately, deleted) books returned per /api/books/changes/ call
+BOOKS_CHANGES_BATCH_SIZE = int(os.environ.get('BOOKS_CHANGES_BATCH_SIZE', 200))
+
+# Caught-up /api/books/changes/ tokens stay this far behind now, so rows committed late are re-read
+BOOKS_CHANGES_OVERLAP_SECONDS = int(os.environ.get('BOOKS_CHANGES_OVERLAP_SECONDS', 30))
+
+# `manage.py prune_book_tombstones` drops deletes older than this; older sync tokens get 410
+BOOKS_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('BOOKS_TOMBSTONE_RETENTION_DAYS', 30))
+
+# `manage.py archive_messages` moves contact messages older than this into ArchivedContactMessage
+MESSAGES_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGES_ARCHIVE_AFTER_DAYS', 180))
+MESSAGES_ARCHIVE_BATCH_SIZE = int(os.environ.get('MESSAGES_ARCHIVE_BATCH_SIZE', 1000))
+
+# Book detail views are buffered per worker and flushed to Book.view_count this often (seconds; 0 = only on worker exit)
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 10))
+
 # Email settings: prefer SMTP when env vars provided, otherwise use console backend for dev
 if os.environ.get('EMAIL_HOST'):
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -0,0 +1,45 @@
+# gunicorn -c gunicorn.conf.py backend.wsgi
+# preload_app imports backend.wsgi once in the master; on_starting then runs api.warmup.warm_up
+# there, so workers forked during scale-out start with URLs, serializers and DRF already loaded.
+# Set GUNICORN_PRELOAD=0 to load the app in each worker instead (no warm-up).
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def _requests_per_worker(cfg):
+    # a sync worker serves one request at a time (threads > 1 makes gunicorn use gthread)
+    if cfg.worker_class_str in ('sync', 'gthread'):
+        return cfg.threads
+    return cfg.worker_connections
+
+
+def on_starting(server):
+    # without preload the master never loads Django, so there is nothing to warm
+    if server.cfg.preload_app:
+        from api import bulkhead
+        from api.warmup import warm_up
+        bulkhead.warn_if_process_local(server.log, _requests_per_worker(server.cfg))
+        warm_up()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from api import bulkhead
+        bulkhead.warn_if_process_local(worker.log, _requests_per_worker(worker.cfg))
+
+
+def post_fork(server, worker):
+    from api.warmup import connect_worker
+    connect_worker()
+
+
+def worker_exit(server, worker):
+    # write out this worker's buffered book views before it goes away
+    from api import view_counter
+    try:
+        view_counter.flush()
+    except Exception:
+        server.log.exception('could not flush view counts on exit')
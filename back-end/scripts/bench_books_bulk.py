@@ -0,0 +1,60 @@
+"""Compare /api/books/bulk/ against N individual /api/books/<id>/ fetches.
+
+Run from the back-end directory: python scripts/bench_books_bulk.py [count]
+Uses a throwaway test database, so the dev db.sqlite3 is left untouched.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from api.models import Book
+
+User = get_user_model()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        sellers = [User.objects.create(username=f'seller{i}') for i in range(10)]
+        books = Book.objects.bulk_create(
+            Book(name=f'Book {i}', author='Author', price=10, owner=sellers[i % len(sellers)])
+            for i in range(count)
+        )
+        ids = [b.pk for b in books]
+        client = Client()
+
+        with CaptureQueriesContext(connection) as single_q:
+            start = time.perf_counter()
+            for pk in ids:
+                client.get(f'/api/books/{pk}/')
+            single_time = time.perf_counter() - start
+
+        with CaptureQueriesContext(connection) as bulk_q:
+            start = time.perf_counter()
+            client.get('/api/books/bulk/', {'ids': ','.join(str(pk) for pk in ids)})
+            bulk_time = time.perf_counter() - start
+
+        print(f'{count} books')
+        print(f'individual: {single_time * 1000:.1f} ms, {len(single_q.captured_queries)} queries')
+        print(f'bulk:       {bulk_time * 1000:.1f} ms, {len(bulk_q.captured_queries)} queries')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Bytes on the wire and CPU per request for /api/books/ with and without compression.
+
+Run from the back-end directory: python scripts/bench_compression.py [requests]
+Uses a throwaway test database, so the dev db.sqlite3 is left untouched.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from api import middleware
+from api.models import Book
+
+User = get_user_model()
+
+
+def run(client, n, accept):
+    cache.clear()
+    headers = {'HTTP_ACCEPT_ENCODING': accept} if accept else {}
+    total = 0
+    cpu = time.process_time()
+    for _ in range(n):
+        res = client.get('/api/books/', **headers)
+        total += len(res.content)
+    cpu = time.process_time() - cpu
+    return total / n, cpu / n, res.get('Content-Encoding', 'identity')
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        sellers = [User.objects.create(username=f'seller{i}', email=f'seller{i}@example.com') for i in range(3)]
+        Book.objects.bulk_create(
+            Book(name=f'Introduction to Subject {i}', author='Some Author', category='science',
+                 description='Lightly used, some highlighting. ' * 4, price=12, owner=sellers[i % 3])
+            for i in range(50)
+        )
+        client = Client()
+        encodings = ['', 'gzip'] + (['br'] if middleware.brotli else [])
+        print(f'/api/books/ x {n} requests (brotli {"available" if middleware.brotli else "not installed"})')
+        for accept in encodings:
+            size, cpu, used = run(client, n, accept)
+            print(f'  Accept-Encoding {accept or "(none)":8} -> {used:8} {size:8.0f} bytes/request {cpu * 1000:6.2f} ms CPU/request')
+            if accept:
+                # same again with the compressed-body cache off, i.e. compressing on every hit
+                with override_settings(COMPRESSION_CACHE_MAX_SIZE=0):
+                    size, cpu, used = run(Client(), n, accept)
+                print(f'  {"  (no cache)":25} -> {used:8} {size:8.0f} bytes/request {cpu * 1000:6.2f} ms CPU/request')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
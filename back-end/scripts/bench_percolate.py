@@ -0,0 +1,78 @@
+"""Measure how fast new listings are matched against many saved searches.
+
+Run from the back-end directory: python scripts/bench_percolate.py [searches] [books]
+Uses a throwaway test database, so the dev db.sqlite3 is left untouched.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from api.models import Book, SavedSearch
+from api.percolator import match_book
+
+User = get_user_model()
+
+WORDS = ['calculus', 'algebra', 'physics', 'chemistry', 'biology', 'history', 'economics', 'statistics',
+         'organic', 'linear', 'introduction', 'advanced', 'principles', 'modern', 'applied', 'discrete']
+WORDS += [f'topic{i}' for i in range(2000)]
+CATEGORIES = ['math', 'science', 'history', 'economics', 'language', 'engineering']
+
+
+def main():
+    n_searches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_books = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(42)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        users = User.objects.bulk_create(User(username=f'u{i}') for i in range(200))
+        searches = []
+        for i in range(n_searches):
+            s = SavedSearch(
+                user=users[i % len(users)],
+                # a small share are category-only searches, which every book in that category hits
+                query='' if rng.random() < 0.01 else ' '.join(rng.sample(WORDS, rng.choice([1, 1, 2]))),
+                category=rng.choice(CATEGORIES) if rng.random() < 0.3 else '',
+                max_price=rng.choice([None, 20, 30, 50]),
+            )
+            if not (s.query or s.category):
+                s.query = rng.choice(WORDS)
+            s.refresh_index()
+            searches.append(s)
+        SavedSearch.objects.bulk_create(searches, batch_size=2000)
+
+        seller = users[0]
+        books = [
+            Book(name=' '.join(rng.sample(WORDS, 3)), author='Author', category=rng.choice(CATEGORIES),
+                 price=rng.choice([15, 25, 45]), owner=seller)
+            for _ in range(n_books)
+        ]
+        matched = 0
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for book in books:
+                matched += len(match_book(book))
+            elapsed = time.perf_counter() - start
+
+        print(f'{n_searches} saved searches, {n_books} new books')
+        print(f'{matched} matches in {elapsed * 1000:.1f} ms: {n_books / elapsed:.0f} books/s, {matched / elapsed:.0f} matches/s')
+        print(f'{len(queries.captured_queries) / n_books:.1f} queries per book')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()